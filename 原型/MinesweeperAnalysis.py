@@ -0,0 +1,263 @@
+'''
+棋盘的难度统计: 3BV、开口、岛、ZiNi
+
+一次按下标顺序的线性扫描, 用并查集把相邻的空白(数字为0的格子)合并成开口, 把不与空白相邻的数字合并成岛:
+    开口(opening): 8连通的空白区域, 点开其中任意一格即可展开整个区域及其边上的数字
+    孤立数字: 不与任何空白相邻的非雷格子, 只能一个一个点开
+    岛(island): 8连通的孤立数字区域
+    3BV: 开口数 + 孤立数字数, 即不标旗、不双击时点开所有非雷格子最少需要的点击数
+    ZiNi: 允许标旗和双击(open_final)时所需点击数的贪心估计, 第一次访问时计算
+格子的下标与位棋盘相同, 第 x 列第 y 行为 x * Height + y.
+'''
+import heapq
+from MinesweeperGenerate import board_geometry
+
+class BoardStats:
+    '''
+    一个棋盘的统计, 由 analyze 生成
+
+    属性:
+        Width, Height: 棋盘大小
+        mineCount: 雷数
+        bbbv: 3BV
+        openings: 开口数
+        opening_sizes: 各开口点开后展开的格子数(空白及其边上的数字), 按开口中最小的下标排列, list[int]
+        isolated: 孤立数字数
+        islands: 岛数
+        zini: ZiNi估计, 第一次访问时计算
+    '''
+    def __init__(self, geometry, mines, zeros, isolated, opening_sizes, islands):
+        self.Width = geometry.Width
+        self.Height = geometry.Height
+        self.mineCount = sum(mines)
+        self.openings = len(opening_sizes)
+        self.opening_sizes = opening_sizes
+        self.isolated = sum(isolated)
+        self.islands = islands
+        self.bbbv = self.openings + self.isolated
+        self.__geometry = geometry
+        self.__mines = mines
+        self.__zeros = zeros
+        self.__zini = None
+
+    @property
+    def zini(self):
+        if self.__zini is None:
+            self.__zini = self.__calculate_zini()
+        return self.__zini
+
+    def __calculate_zini(self):
+        '''
+        贪心估计: 先点开所有开口, 再反复选收益最大的数字, 标出它周围的雷并双击,
+        收益 = 双击点开的孤立数字数 - 代价, 代价 = 标旗数 + 双击 + 数字本身未点开时的一次点击,
+        每次双击计入代价的点击数, 没有收益为正的数字后, 剩下的孤立数字一个一个点开.
+        点开所有开口后未点开的非雷格子都是孤立数字, 展开不会连锁, 所以每次操作只影响5×5范围内数字的收益.
+        '''
+        around = self.__geometry.around_index
+        height = self.Height
+        mines = self.__mines
+        revealed = bytearray(len(mines))
+        flagged = bytearray(len(mines))
+        for p, zero in enumerate(self.__zeros):
+            if zero:
+                for q in around[p]:
+                    revealed[q] = 1
+        clicks = self.openings
+
+        def cost(p):
+            return (1 if revealed[p] else 2) + sum([1 - flagged[q] for q in around[p] if mines[q]])
+
+        def premium(p):
+            return sum([1 for q in around[p] if not mines[q] and not revealed[q]]) - cost(p)
+
+        current = [premium(p) if not mines[p] and not self.__zeros[p] else 0 for p in range(len(mines))]
+        heap = [(-v, p) for p, v in enumerate(current) if v > 0]
+        heapq.heapify(heap)
+        while heap:
+            v, p = heapq.heappop(heap)
+            if -v != current[p]:
+                continue
+            clicks += cost(p)
+            for q in around[p]:
+                if mines[q]:
+                    flagged[q] = 1
+                else:
+                    revealed[q] = 1
+            x, y = divmod(p, height)
+            for i, j in self.__geometry.around5[x][y]:
+                q = i * height + j
+                if mines[q] or self.__zeros[q]:
+                    continue
+                v = premium(q)
+                if v != current[q]:
+                    current[q] = v
+                    if v > 0:
+                        heapq.heappush(heap, (-v, q))
+        return clicks + sum([1 for p in range(len(mines)) if not mines[p] and not revealed[p]])
+
+    def as_dict(self):
+        '用于批量统计的 dict, 包含 ZiNi'
+        return {
+            '3BV': self.bbbv,
+            'openings': self.openings,
+            'opening_sizes': self.opening_sizes,
+            'isolated': self.isolated,
+            'islands': self.islands,
+            'zini': self.zini,
+        }
+
+def _find(parent, p):
+    root = p
+    while parent[root] != root:
+        root = parent[root]
+    while parent[p] != root:
+        parent[p], p = root, parent[p]
+    return root
+
+def _union(parent, cells, member, around):
+    '''
+    按下标顺序把 cells 中8连通的格子合并, 每格只与下标更小的相邻格合并
+
+    参数:
+        parent: 并查集
+        cells: 要合并的格子的下标, 升序
+        member: member[q] 为q是否属于 cells
+        around: 每格3×3范围内格子的下标
+
+    返回值:
+        各区域的根, 即区域中最小的下标, 升序
+    '''
+    roots = []
+    for p in cells:
+        root = p
+        for q in around[p]:
+            if q < p and member[q]:
+                r = _find(parent, q)
+                if root == p:
+                    root = parent[p] = r
+                elif r != root:
+                    # 两个区域在p处相连, 保留下标较小的根
+                    if r < root:
+                        root, r = r, root
+                    parent[r] = parent[p] = root
+        if root == p:
+            roots.append(p)
+    # 之后合并进别的区域的根不再是根
+    return [p for p in roots if parent[p] == p]
+
+def analyze(mines, numbers = None):
+    '''
+    分析一个棋盘
+
+    参数:
+        mines: 雷的分布, list[list[bool]], 也可以是形状为 (宽, 高) 的 numpy 数组
+        numbers: 已经算好的数字, 按下标排列的整数序列(例如位棋盘的数字字节串), None为由mines计算
+
+    返回值:
+        BoardStats
+    '''
+    if hasattr(mines, 'tolist'):
+        mines = mines.tolist()
+    geometry = board_geometry(len(mines), len(mines[0]))
+    around = geometry.around_index
+    size = geometry.Size
+    flat = [bool(cell) for col in mines for cell in col]
+    if numbers is None:
+        numbers = [0] * size
+        for p in [p for p in range(size) if flat[p]]:
+            for q in around[p]:
+                numbers[q] += 1
+    zeroCells = [p for p in range(size) if numbers[p] == 0 and not flat[p]]
+    zeros = bytearray(size)
+    # 点开所有开口后展开的格子: 空白及其边上的数字
+    opened = bytearray(size)
+    for p in zeroCells:
+        zeros[p] = 1
+        for q in around[p]:
+            opened[q] = 1
+    isolatedCells = [p for p in range(size) if not opened[p] and not flat[p]]
+    isolated = bytearray(size)
+    for p in isolatedCells:
+        isolated[p] = 1
+
+    parent = list(range(size))
+    openingRoots = _union(parent, zeroCells, zeros, around)
+    islands = len(_union(parent, isolatedCells, isolated, around))
+    # 开口的大小: 空白数加上边上的数字数, 一个数字可能与两个开口相邻
+    sizes = dict.fromkeys(openingRoots, 0)
+    for p in range(size):
+        if zeros[p]:
+            sizes[_find(parent, p)] += 1
+        elif opened[p]:
+            for r in set([_find(parent, q) for q in around[p] if zeros[q]]):
+                sizes[r] += 1
+    return BoardStats(geometry, flat, zeros, isolated, list(sizes.values()), islands)
+
+# 手算结果的小棋盘: (每列一个字符串, '*'为雷), 期望的统计
+# 3×3中间一个雷: 点开(0,1)、标雷、双击(0,1), 双击(1,0), 再点开(2,2), ZiNi为5
+_CHECKS = [
+    (['...', '.*.', '...'], {'3BV': 8, 'openings': 0, 'opening_sizes': [], 'isolated': 8, 'islands': 1, 'zini': 5}),
+    (['*', '.', '.', '.', '*'], {'3BV': 1, 'openings': 1, 'opening_sizes': [3], 'isolated': 0, 'islands': 0, 'zini': 1}),
+    (['*..', '...', '..*'], {'3BV': 2, 'openings': 2, 'opening_sizes': [4, 4], 'isolated': 0, 'islands': 0, 'zini': 2}),
+]
+
+def check():
+    '''
+    用 _CHECKS 中手算的棋盘检查 analyze
+
+    返回值:
+        是否全部一致
+    '''
+    ok = True
+    for columns, expected in _CHECKS:
+        stats = analyze([[c == '*' for c in col] for col in columns]).as_dict()
+        if stats != expected:
+            print(f'{columns}: expected {expected}, got {stats}')
+            ok = False
+    return ok
+
+def main():
+    import argparse
+    from time import perf_counter
+    from MinesweeperGenerate import Minesweeper
+    parser = argparse.ArgumentParser(description='measure board analysis speed and show difficulty statistics')
+    parser.add_argument('width', type=int, nargs='?', default=30, help='width of minesweeper board (default: 30)')
+    parser.add_argument('height', type=int, nargs='?', default=16, help='height of minesweeper board (default: 16)')
+    parser.add_argument('mineCount', type=int, nargs='?', default=99, help='mine count of minesweeper board (default: 99)')
+    parser.add_argument('-n', '--boards', type=int, default=1000, help='number of boards (default: 1000)')
+    parser.add_argument('--zini', action='store_true', help='also estimate ZiNi')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--check', action='store_true', help='only compare with hand-computed statistics of small fixed boards')
+    args = parser.parse_args()
+    if args.check:
+        import sys
+        if not check():
+            sys.exit(1)
+        print(f'{len(_CHECKS)} boards ok')
+        return
+
+    import random
+    random.seed(args.seed)
+    boards = []
+    for _ in range(args.boards):
+        ms = Minesweeper(args.width, args.height)
+        ms.generate(args.mineCount, args.width // 2, args.height // 2)
+        boards.append(ms.mines)
+    start = perf_counter()
+    stats = [analyze(mines) for mines in boards]
+    use_time = perf_counter() - start
+    print(f'boards: {len(stats)}, time: {use_time:.3f}s, {len(stats) / use_time:.0f} boards/s')
+    fields = ['bbbv', 'openings', 'isolated', 'islands']
+    if args.zini:
+        start = perf_counter()
+        for s in stats:
+            s.zini
+        use_time = perf_counter() - start
+        print(f'zini time: {use_time:.3f}s, {len(stats) / use_time:.0f} boards/s')
+        fields.append('zini')
+    for name in fields:
+        values = [getattr(s, name) for s in stats]
+        print(f'{name}: mean {sum(values) / len(values):.2f}, min {min(values)}, max {max(values)}')
+
+if __name__ == "__main__":
+    main()
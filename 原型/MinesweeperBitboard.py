@@ -0,0 +1,262 @@
+from MinesweeperGenerate import BoardInfo, BoardView, CellStatus, MineCountError, MinesweeperGenerator, MinesweeperOperator, MinesweeperSaver
+
+# '0'/'1' 字符到 0/1 字节的转换表, 用于把位棋盘展开成字节数组
+_EXPAND_TABLE = bytes.maketrans(b'01', b'\x00\x01')
+_CELL_STATUS = tuple(CellStatus(v) for v in range(11))
+
+class MinesweeperBitboard(MinesweeperOperator, MinesweeperGenerator, MinesweeperSaver):
+    '''
+    位棋盘扫雷类
+
+    与 Minesweeper 接口相同, 但雷、已点开、已标旗以及数字都以位棋盘(Python整数)保存,
+    第 x 列第 y 行的格子对应第 x * Height + y 位.
+    邻居雷数、展开、is_win、remain_mines 都通过整块的移位/掩码运算完成.
+    数字平面以4个位平面(按位加法器)计算, 另外维护一份每格一字节的可见状态, 用于单格查询.
+    '''
+    def __init__(self, width, height):
+        self.boardInfo = BoardInfo(width, height)
+        self._3BV = 0
+        self.__width = width
+        self.__height = height
+        self.__size = width * height
+        self.__full = (1 << self.__size) - 1
+        # 每列第0行组成的掩码: 以 2^Height 为基的全1数
+        top = self.__full // ((1 << height) - 1)
+        self.__not_top = self.__full ^ top
+        self.__not_bottom = self.__full ^ (top << (height - 1))
+        self.__mineCount = 0
+        self.__mines = None
+        self.__zeros = 0
+        self.__revealed = 0
+        self.__flagged = 0
+        self.__numbers = None
+        self.__values = bytearray([CellStatus.Unknown.value]) * self.__size
+        self.__viewCols = [(CellStatus.Unknown,) * height for _ in range(width)]
+        self.__dirtyCols = set()
+        self.__view = None
+
+    def __index(self, x, y):
+        return x * self.__height + y
+
+    def __dilate(self, s):
+        '3×3膨胀'
+        v = s | ((s << 1) & self.__not_top) | ((s >> 1) & self.__not_bottom)
+        return v | ((v << self.__height) & self.__full) | (v >> self.__height)
+
+    def __neighbour_planes(self, s):
+        '8个方向平移后的位棋盘'
+        up = (s << 1) & self.__not_top
+        down = (s >> 1) & self.__not_bottom
+        planes = [up, down]
+        for v in (s, up, down):
+            planes.append((v << self.__height) & self.__full)
+            planes.append(v >> self.__height)
+        return planes
+
+    def __expand(self, plane):
+        '把位棋盘展开成每格一字节(0/1)的字节串'
+        return format(plane, '0{}b'.format(self.__size))[::-1].encode('ascii').translate(_EXPAND_TABLE)
+
+    def __bits(self, plane):
+        '位棋盘中所有为1的位的下标'
+        s = format(plane, 'b')[::-1]
+        p = s.find('1')
+        while p >= 0:
+            yield p
+            p = s.find('1', p + 1)
+
+    def __pack(self, mines):
+        '把 list[list[bool]] 压成位棋盘'
+        bits = ''.join('1' if cell else '0' for col in mines for cell in col)
+        return int(bits[::-1], 2) if bits else 0
+
+    def __calculate_numbers(self):
+        '按位加法器累加8个方向的雷平面, 得到4个数字位平面, 再一次性转换成字节数组'
+        counter = [0, 0, 0, 0]
+        for plane in self.__neighbour_planes(self.__mines):
+            carry = plane
+            for k in range(4):
+                counter[k], carry = counter[k] ^ carry, counter[k] & carry
+        # 每个字节至多为15, 按字节相加不会产生进位
+        numbers = sum(int.from_bytes(self.__expand(counter[k]), 'little') << k for k in range(4))
+        self.__numbers = numbers.to_bytes(self.__size, 'little')
+        self.__zeros = self.__full & ~(self.__mines | counter[0] | counter[1] | counter[2] | counter[3])
+
+    def __calculate_3BV(self):
+        safe = self.__full & ~self.__mines
+        self._3BV = (safe & ~self.__dilate(self.__zeros)).bit_count()
+        remain = self.__zeros
+        while remain:
+            region = remain & -remain
+            while True:
+                grown = self.__dilate(region) & self.__zeros
+                if grown == region:
+                    break
+                region = grown
+            remain &= ~region
+            self._3BV += 1
+
+    def __set_mines(self, plane):
+        self.__mines = plane
+        self.__calculate_numbers()
+        self.__calculate_3BV()
+
+    def generate(self, mineCount, x, y):
+        assert self.__mines is None
+        import random
+        self.boardInfo.xycheck(x, y)
+        if mineCount < 1:
+            raise MineCountError('雷数小于1')
+        elif mineCount > self.boardInfo.MaxMineCount:
+            raise MineCountError('雷数大于{}'.format(self.boardInfo.MaxMineCount))
+        self.__mineCount = mineCount
+        safe = self.__dilate(1 << self.__index(x, y))
+        size = self.__size - safe.bit_count()
+
+        minelist = [True] * mineCount + [False] * (size - mineCount)
+        random.shuffle(minelist)
+        # 与 Minesweeper.generate 相同的填充顺序: 按列优先跳过初始点周围的格子
+        free = [p for p in range(self.__size) if not (safe >> p) & 1]
+        assert len(free) == size
+        plane = 0
+        for p, isMine in zip(free, minelist):
+            if isMine:
+                plane |= 1 << p
+        self.__set_mines(plane)
+
+    @property
+    def cells(self):
+        '所有格子的状态, list[list[CellStatus]]'
+        return self.cells_view.copy()
+
+    @property
+    def all_cells(self):
+        return self.cells_view.copy()
+
+    @property
+    def cells_view(self):
+        if self.__view is None:
+            h = self.__height
+            values = self.__values
+            for x in self.__dirtyCols:
+                self.__viewCols[x] = tuple([_CELL_STATUS[v] for v in values[x * h:(x + 1) * h]])
+            self.__dirtyCols.clear()
+            self.__view = BoardView(self.__viewCols, bytes(values))
+        return self.__view
+
+    def __touch(self, changed):
+        '格子状态变化后, 使视图失效并通知订阅者'
+        for x, _, _ in changed:
+            self.__dirtyCols.add(x)
+        self.__view = None
+        self._notify(changed)
+
+    def open(self, x, y, with_changes = False):
+        self.boardInfo.xycheck(x, y)
+        p = self.__index(x, y)
+        changed = []
+        if (self.__mines >> p) & 1:
+            return (False, changed) if with_changes else False
+        if self.__values[p] != CellStatus.Unknown.value:
+            return (True, changed) if with_changes else True
+
+        blocked = self.__mines | self.__flagged | self.__revealed
+        region = front = 1 << p
+        while front & self.__zeros:
+            front = self.__dilate(front & self.__zeros) & ~(blocked | region)
+            region |= front
+        self.__revealed |= region
+        for q in self.__bits(region):
+            self.__values[q] = self.__numbers[q]
+            changed.append((q // self.__height, q % self.__height, _CELL_STATUS[self.__numbers[q]]))
+        self.__touch(changed)
+        return (True, changed) if with_changes else True
+
+    def flag(self, x, y, with_changes = False):
+        self.boardInfo.xycheck(x, y)
+        p = self.__index(x, y)
+        changed = []
+        if self.__values[p] == CellStatus.Flagged.value:
+            self.__values[p] = CellStatus.Unknown.value
+            self.__flagged &= ~(1 << p)
+        elif self.__values[p] == CellStatus.Unknown.value:
+            self.__values[p] = CellStatus.Flagged.value
+            self.__flagged |= 1 << p
+        if self.__values[p] >= CellStatus.Unknown.value:
+            changed.append((x, y, _CELL_STATUS[self.__values[p]]))
+            self.__touch(changed)
+        if with_changes:
+            return changed
+
+    def open_final(self, x, y, with_changes = False):
+        p = self.__index(x, y)
+        value = self.__values[p]
+        changed = []
+        if value not in range(1, 9):
+            return (True, changed) if with_changes else True
+
+        around = self.__dilate(1 << p)
+        if value == (self.__flagged & around).bit_count():
+            for q in self.__bits(around & ~(self.__revealed | self.__flagged)):
+                alive, opened = self.open(q // self.__height, q % self.__height, True)
+                changed += opened
+                if not alive:
+                    return (False, changed) if with_changes else False
+        return (True, changed) if with_changes else True
+
+    def is_win(self):
+        return self.__revealed | self.__mines == self.__full
+
+    @property
+    def remain_mines(self):
+        return self.__mineCount - self.__flagged.bit_count()
+
+    def show(self, cells = None):
+        s=''
+        b='.12345678@Ffxt'
+        if cells is None:
+            for col in self.cells:
+                for cell in col:
+                    s+=b[cell.value]
+                s+='\n'
+            print(s)
+            s=''
+            for col in self.mines:
+                for cell in col:
+                    s+='*' if cell else '.'
+                s+='\n'
+        else:
+            for col in cells:
+                for cell in col:
+                    s+=b[cell.value]
+                s+='\n'
+        print(s)
+
+    @property
+    def mines(self):
+        '''
+        雷的分布, 返回list[list[bool]]
+        '''
+        if self.__mines is None:
+            return None
+        h = self.__height
+        expanded = self.__expand(self.__mines)
+        return [[v == 1 for v in expanded[x * h:(x + 1) * h]] for x in range(self.__width)]
+
+    @property
+    def stats(self):
+        '第一次访问时用已经算好的数字分析棋盘并缓存, 见 MinesweeperSaver.stats'
+        if self._stats is None and self.__mines is not None:
+            from MinesweeperAnalysis import analyze
+            self._stats = analyze(self.mines, self.__numbers)
+        return self._stats
+
+    @mines.setter
+    def mines(self, mines):
+        assert len(mines) == self.boardInfo.Width
+        assert all([len(col) == self.boardInfo.Height for col in mines])
+        assert all([isinstance(cell, bool) for col in mines for cell in col])
+        assert self.__mines is None
+        plane = self.__pack(mines)
+        self.__mineCount = plane.bit_count()
+        self.__set_mines(plane)
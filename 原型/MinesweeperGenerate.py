@@ -1,5 +1,7 @@
 from enum import Enum
 from abc import abstractmethod, abstractproperty, ABCMeta
+from functools import lru_cache
+from array import array
 
 class CellStatus(Enum):
     '''
@@ -38,6 +40,9 @@ class CellStatus(Enum):
     ToSpace = 12
     ToFlagOrSpace = 13
 
+# 数字对应的状态, 下标为3×3范围内的雷数
+_NUMBER_STATUS = tuple([CellStatus(v) for v in range(10)])
+
 class BoardSizeError(Exception):
     '''
     异常:
@@ -62,6 +67,14 @@ class MineCountError(Exception):
     def __init__(self, msg):
         self.message = msg
 
+class ReadOnlyError(Exception):
+    '''
+    异常:
+        在只读的棋盘(例如保存下来的局面)上点开或标旗
+    '''
+    def __init__(self, msg):
+        self.message = msg
+
 class BoardInfo:
     '''
     棋盘信息
@@ -81,6 +94,11 @@ class BoardInfo:
         '棋盘最大雷数，用于棋盘生成'
         return self.Width * self.Height - 9
 
+    @property
+    def geometry(self):
+        '同样大小的棋盘共用的 BoardGeometry'
+        return board_geometry(self.Width, self.Height)
+
     def xycheck(self, x, y):
         '''
         检测一个点的坐标是否合法
@@ -98,6 +116,159 @@ class BoardInfo:
         if x < 0 or x >= self.Width or y < 0 or y >= self.Height:
             raise XYCheckError('坐标 ({}, {}) 不合法, 棋盘宽: {}, 棋盘高: {}'.format(x, y, self.Width, self.Height))
 
+# 不超过这个格子数的棋盘, 周围格子的表另外保存为 tuple 的 tuple, 查询最快;
+# 更大的棋盘 window 每次查询时现算, window_index 只保存连续的 array
+WINDOW_TABLE_LIMIT = 1 << 16
+
+class IndexWindow:
+    '''
+    按下标给出每格周围 (2r+1)×(2r+1) 范围内格子的下标
+
+    所有格子的表连续保存在一个 array('i') 中, offsets[p] 为格子p的表的起点,
+    window[p] 为格子p的表(array 的切片), 顺序与先列后行的两重循环相同.
+    格子数不超过 WINDOW_TABLE_LIMIT 时 rows 为每格一个 tuple 的表, 否则为None.
+    '''
+    def __init__(self, width, height, r, withSelf = True):
+        self.data = array('i')
+        self.offsets = array('i', [0])
+        for x in range(width):
+            cols = range(max(0, x-r), min(width, x+r+1))
+            for y in range(height):
+                rows = range(max(0, y-r), min(height, y+r+1))
+                self.data.extend([i * height + j for i in cols for j in rows if withSelf or i != x or j != y])
+                self.offsets.append(len(self.data))
+        self.rows = None
+        if width * height <= WINDOW_TABLE_LIMIT:
+            self.rows = tuple([tuple(self[p]) for p in range(width * height)])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, p):
+        return self.data[self.offsets[p]:self.offsets[p + 1]]
+
+class _CellWindowColumn:
+    '大棋盘的 window(r)[x], 查询时现算'
+    def __init__(self, geometry, x, r, withSelf):
+        self.__cols = range(max(0, x-r), min(geometry.Width, x+r+1))
+        self.__height = geometry.Height
+        self.__x = x
+        self.__r = r
+        self.__withSelf = withSelf
+
+    def __len__(self):
+        return self.__height
+
+    def __getitem__(self, y):
+        r = self.__r
+        return tuple([
+            (i, j)
+            for i in self.__cols
+                for j in range(max(0, y-r), min(self.__height, y+r+1))
+                    if self.__withSelf or i != self.__x or j != y
+        ])
+
+class _CellWindow:
+    '大棋盘的 window(r), 查询时现算'
+    def __init__(self, geometry, r, withSelf):
+        self.__columns = [_CellWindowColumn(geometry, x, r, withSelf) for x in range(geometry.Width)]
+
+    def __len__(self):
+        return len(self.__columns)
+
+    def __getitem__(self, x):
+        return self.__columns[x]
+
+class BoardGeometry:
+    '''
+    棋盘的几何信息: 每格周围格子的表, 同样大小的棋盘共用一份, 用 board_geometry 取得
+    所有的表都在第一次使用时才建立, 创建 BoardGeometry 本身不做任何计算.
+
+    格子的下标与位棋盘相同, 第 x 列第 y 行为 x * Height + y.
+    around[x][y]: 3×3范围内的格子(含自身), tuple[(i, j)]
+    neighbours[x][y]: 3×3范围内的其他格子
+    around5[x][y], neighbours5[x][y]: 5×5范围内的格子(含自身)/其他格子
+    around_index[p]: 下标为p的格子3×3范围内(含自身)格子的下标, 即 window_index(1)
+    表中格子的顺序都与先列后行的两重循环相同.
+    格子数超过 WINDOW_TABLE_LIMIT 时 window 不保存表, 每次查询现算; window_index 只保存为连续的 IndexWindow.
+    '''
+    def __init__(self, width, height):
+        self.Width = width
+        self.Height = height
+        self.Size = width * height
+        self.__windows = {}
+
+    def __reduce__(self):
+        # 传给子进程时只传大小, 在子进程中重新取得共用的一份
+        return (board_geometry, (self.Width, self.Height))
+
+    def index(self, x, y):
+        return x * self.Height + y
+
+    def window(self, r, withSelf = True):
+        '''
+        每格周围 (2r+1)×(2r+1) 范围内的格子, 第一次使用时建立
+
+        返回值:
+            window(r)[x][y] 为 tuple[(i, j)]
+        '''
+        key = (r, withSelf)
+        if key not in self.__windows:
+            if self.Size > WINDOW_TABLE_LIMIT:
+                self.__windows[key] = _CellWindow(self, r, withSelf)
+            else:
+                self.__windows[key] = tuple([
+                    tuple([
+                        tuple([
+                            (i, j)
+                            for i in range(max(0, x-r), min(self.Width, x+r+1))
+                                for j in range(max(0, y-r), min(self.Height, y+r+1))
+                                    if withSelf or i != x or j != y
+                        ])
+                        for y in range(self.Height)
+                    ])
+                    for x in range(self.Width)
+                ])
+        return self.__windows[key]
+
+    def window_index(self, r, withSelf = True):
+        '''
+        与 window 相同, 但按下标给出, 第一次使用时建立
+
+        返回值:
+            window_index(r)[p] 为下标的序列; 小棋盘为 IndexWindow.rows, 大棋盘为 IndexWindow
+        '''
+        key = ('index', r, withSelf)
+        if key not in self.__windows:
+            table = IndexWindow(self.Width, self.Height, r, withSelf)
+            self.__windows[key] = table if table.rows is None else table.rows
+        return self.__windows[key]
+
+    @property
+    def around(self):
+        return self.window(1)
+
+    @property
+    def neighbours(self):
+        return self.window(1, False)
+
+    @property
+    def around_index(self):
+        return self.window_index(1)
+
+    @property
+    def around5(self):
+        return self.window(2)
+
+    @property
+    def neighbours5(self):
+        return self.window(2, False)
+
+@lru_cache(maxsize=8)
+def board_geometry(width, height):
+    '取得 width×height 的棋盘共用的 BoardGeometry'
+    return BoardGeometry(width, height)
+
 class MinesweeperGenerator(metaclass=ABCMeta):
     '用于生成扫雷棋盘的接口类'
     @abstractmethod
@@ -114,21 +285,62 @@ class MinesweeperGenerator(metaclass=ABCMeta):
         '''
         pass
 
+class BoardView:
+    '''
+    棋盘的只读视图(快照)
+
+    每列保存为一个 tuple, 可以像 list[list[CellStatus]] 一样用 view[x][y] 读取,
+    多个使用者共享同一份数据而不需要拷贝; 需要修改时调用 copy() (写时复制).
+    '''
+    def __init__(self, cols, flat = None):
+        self.__cols = tuple(cols)
+        self.__flat = flat
+
+    def __getitem__(self, x):
+        return self.__cols[x]
+
+    def __len__(self):
+        return len(self.__cols)
+
+    def __iter__(self):
+        return iter(self.__cols)
+
+    def copy(self):
+        '可修改的拷贝, list[list[CellStatus]]'
+        return [list(col) for col in self.__cols]
+
+    def flat(self):
+        '按 x * Height + y 排列的所有格子的状态值, bytes'
+        if self.__flat is None:
+            self.__flat = bytes([cell.value for col in self.__cols for cell in col])
+        return self.__flat
+
 class MinesweeperOperator(metaclass=ABCMeta):
     '用于操作扫雷的接口类'
 
     @abstractproperty
     def all_cells(self):
         '''
-        获取一个扫雷棋盘中所有格子的状态的深拷贝
+        获取一个扫雷棋盘中所有格子的状态的拷贝
 
         返回值:
             所有格子的状态, list[list[CellStatus]]
         '''
         pass
 
+    @property
+    def cells_view(self):
+        '''
+        获取一个扫雷棋盘中所有格子的状态的只读视图, 不拷贝
+        只读取时应使用此属性代替 all_cells
+
+        返回值:
+            所有格子的状态, BoardView
+        '''
+        return BoardView([tuple(col) for col in self.all_cells])
+
     @abstractmethod
-    def open(self, x, y):
+    def open(self, x, y, with_changes = False):
         '''
         点开一个扫雷棋盘中的格子
         只能点CellStatus.Unknown状态的格子
@@ -136,14 +348,16 @@ class MinesweeperOperator(metaclass=ABCMeta):
         参数:
             x: 横坐标 ∈[0,Width)
             y: 纵坐标 ∈[0,Height)
+            with_changes: 是否同时返回状态改变了的格子
 
         返回值:
             是否踩雷, bool
+            with_changes为True时返回 (是否踩雷, 状态改变了的格子 list[(x, y, CellStatus)])
         '''
         pass
 
     @abstractmethod
-    def flag(self, x, y):
+    def flag(self, x, y, with_changes = False):
         '''
         对一个扫雷棋盘中的格子标旗
         只能标旗CellStatus.Unknown状态的格子
@@ -151,23 +365,27 @@ class MinesweeperOperator(metaclass=ABCMeta):
         参数:
             x: 横坐标 ∈[0,Width)
             y: 纵坐标 ∈[0,Height)
+            with_changes: 是否返回状态改变了的格子
 
         返回值:
             无
+            with_changes为True时返回状态改变了的格子 list[(x, y, CellStatus)]
         '''
         pass
 
     @abstractmethod
-    def open_final(self, x, y):
+    def open_final(self, x, y, with_changes = False):
         '''
         当数字与其周围的标旗数相同时，自动展开数字周围
 
         参数:
             x: 横坐标 ∈[0,Width)
             y: 纵坐标 ∈[0,Height)
+            with_changes: 是否同时返回状态改变了的格子
 
         返回值:
             是否踩雷, bool
+            with_changes为True时返回 (是否踩雷, 状态改变了的格子 list[(x, y, CellStatus)])
         '''
         pass
 
@@ -181,6 +399,25 @@ class MinesweeperOperator(metaclass=ABCMeta):
         '剩余雷数, 返回int'
         pass
 
+    _listeners = ()
+
+    def subscribe(self, callback):
+        '''
+        订阅格子状态的变化, 每次open/flag改变了格子状态后调用callback
+
+        参数:
+            callback: 参数为状态改变了的格子, list[(x, y, CellStatus)], 其中CellStatus为改变后的状态
+        '''
+        self._listeners = self._listeners + (callback,)
+
+    def unsubscribe(self, callback):
+        '取消订阅'
+        self._listeners = tuple([c for c in self._listeners if c != callback])
+
+    def _notify(self, changed):
+        for callback in self._listeners:
+            callback(changed)
+
 class MinesweeperSaver(metaclass=ABCMeta):
     '''
     保存扫雷棋盘
@@ -192,16 +429,43 @@ class MinesweeperSaver(metaclass=ABCMeta):
         '''
         pass
 
+    _stats = None
+
+    @property
+    def stats(self):
+        '''
+        棋盘的统计(3BV、开口、岛、ZiNi等), 第一次访问时分析 mines 并缓存
+
+        返回值:
+            MinesweeperAnalysis.BoardStats
+        '''
+        if self._stats is None:
+            from MinesweeperAnalysis import analyze
+            self._stats = analyze(self.mines)
+        return self._stats
+
 class Minesweeper(MinesweeperOperator, MinesweeperGenerator, MinesweeperSaver):
     '''
     扫雷类
+
+    已点开的格子数和标旗数在 open/flag 中增量维护, is_win 和 remain_mines 为常数时间.
+    check_counters为True时, 每次查询都会用全盘扫描校验这两个计数.
     '''
-    def __init__(self, width, height):
+    def __init__(self, width, height, check_counters = False):
         self.boardInfo = BoardInfo(width, height)
+        self.__geometry = self.boardInfo.geometry
         self.cells = [[CellStatus.Unknown for _ in range(height)] for _ in range(width)]
         self._3BV = 0
+        self.check_counters = check_counters
         self.__mineCount = 0
         self.__mines = None
+        self.__numbers = None
+        self.__counts = None
+        self.__openedCount = 0
+        self.__flagCount = 0
+        self.__viewCols = [tuple(col) for col in self.cells]
+        self.__dirtyCols = set()
+        self.__view = None
 
     def generate(self, mineCount, x, y):
         assert self.__mines is None
@@ -240,100 +504,136 @@ class Minesweeper(MinesweeperOperator, MinesweeperGenerator, MinesweeperSaver):
             self.__mines.append(col)
         assert cI == size
 
+        self.__calculate_numbers()
         self.__calculate_3BV()
 
-    def __calculate_3BV(self):
-        tempCells = []
-        for i in range(self.boardInfo.Width):
-            col = []
-            for j in range(self.boardInfo.Height):
-                if self.__mines[i][j]:
-                    col.append(2)
-                elif any([self.__mines[ii][jj] for ii, jj in self.__neighbours(i, j)]):
-                    col.append(1)
-                else:
-                    col.append(0)
-            tempCells.append(col)
-        def floodfill(i, j):
-            if tempCells[i][j] == 2:
-                return
-            b = tempCells[i][j] == 0
-            tempCells[i][j] = 2
-            if b:
-                for ii, jj in self.__neighbours(i, j):
-                    floodfill(ii, jj)
+    def __calculate_numbers(self):
+        '''
+        设置雷之后一次算出所有格子的数字, 点开时直接查表(雷所在格子的值不会被用到)
+        先按列求上下3格的和, 再把相邻3列相加, 得到3×3范围内(含自身)的雷数, 不需要邻居表;
+        数字按下标排列, 同时保存整数值供 __calculate_3BV 使用
+        '''
+        sums = [
+            [a + b + c for a, b, c in zip([0] + col[:-1], col, col[1:] + [0])]
+            for col in [[1 if cell else 0 for cell in col] for col in self.__mines]
+        ]
+        zero = [0] * self.boardInfo.Height
+        counts = []
+        for x in range(self.boardInfo.Width):
+            left = sums[x - 1] if x > 0 else zero
+            right = sums[x + 1] if x + 1 < self.boardInfo.Width else zero
+            counts += [a + b + c for a, b, c in zip(left, sums[x], right)]
+        self.__counts = counts
+        self.__numbers = [_NUMBER_STATUS[c] for c in counts]
 
-        self._3BV = 0
-        for i in range(self.boardInfo.Width):
-            for j in range(self.boardInfo.Height):
-                if tempCells[i][j] == 0:
-                    self._3BV += 1
-                    floodfill(i, j)
-        for i in range(self.boardInfo.Width):
-            for j in range(self.boardInfo.Height):
-                assert tempCells[i][j] in [1, 2]
-                if tempCells[i][j] != 2:
-                    self._3BV += 1
+    def __calculate_3BV(self):
+        '由 MinesweeperAnalysis 一次线性扫描得到3BV等统计, 缓存为 stats'
+        from MinesweeperAnalysis import analyze
+        self._stats = analyze(self.__mines, self.__counts)
+        self._3BV = self._stats.bbbv
 
     @property
     def all_cells(self):
-        import copy
-        return copy.deepcopy(self.cells)
+        return self.cells_view.copy()
 
-    def open(self, x, y):
+    @property
+    def cells_view(self):
+        if self.__view is None:
+            # 只重新生成有变化的列, 其余列与之前的视图共享
+            for x in self.__dirtyCols:
+                self.__viewCols[x] = tuple(self.cells[x])
+            self.__dirtyCols.clear()
+            self.__view = BoardView(self.__viewCols)
+        return self.__view
+
+    def __touch(self, changed):
+        '格子状态变化后, 使视图失效并通知订阅者'
+        for x, _, _ in changed:
+            self.__dirtyCols.add(x)
+        self.__view = None
+        self._notify(changed)
+
+    def open(self, x, y, with_changes = False):
         self.boardInfo.xycheck(x, y)
+        changed = []
         if self.__mines[x][y]:
-            return False
+            return (False, changed) if with_changes else False
 
-        self.__open_expand(x, y)
-        return True
+        self.__open_expand(x, y, changed)
+        if len(changed) > 0:
+            self.__touch(changed)
+        return (True, changed) if with_changes else True
 
-    def flag(self, x, y):
+    def flag(self, x, y, with_changes = False):
         self.boardInfo.xycheck(x, y)
+        changed = []
         if self.cells[x][y] == CellStatus.Flagged:
             self.cells[x][y] = CellStatus.Unknown
+            self.__flagCount -= 1
         elif self.cells[x][y] == CellStatus.Unknown:
             self.cells[x][y] = CellStatus.Flagged
-
-    def __open_expand(self, x, y):
-        '自动展开空白的周围'
+            self.__flagCount += 1
+        if self.cells[x][y].value >= 9:
+            changed.append((x, y, self.cells[x][y]))
+            self.__touch(changed)
+        if with_changes:
+            return changed
+
+    def __number(self, x, y):
+        return self.__numbers[x * self.boardInfo.Height + y]
+
+    def __open_expand(self, x, y, changed):
+        '自动展开空白的周围, 用队列代替递归'
         if self.cells[x][y] != CellStatus.Unknown:
             return
 
-        self.cells[x][y] = CellStatus(sum([1 if self.__mines[i][j] else 0 for i,j in self.__neighbours(x, y)]))
-        if self.cells[x][y] == CellStatus.Space:
-            for i, j in self.__neighbours(x, y):
-                self.__open_expand(i, j)
-
-    def open_final(self, x, y):
+        self.cells[x][y] = self.__number(x, y)
+        queue = [(x, y)]
+        self.__openedCount += 1
+        for x, y in queue:
+            changed.append((x, y, self.cells[x][y]))
+            if self.cells[x][y] == CellStatus.Space:
+                for i, j in self.__neighbours(x, y):
+                    if self.cells[i][j] == CellStatus.Unknown:
+                        self.cells[i][j] = self.__number(i, j)
+                        self.__openedCount += 1
+                        queue.append((i, j))
+
+    def open_final(self, x, y, with_changes = False):
+        changed = []
         if self.cells[x][y].value not in range(1, 9):
-            return True
+            return (True, changed) if with_changes else True
 
         if self.cells[x][y].value == sum([1 if self.cells[i][j] == CellStatus.Flagged else 0 for i, j in self.__neighbours(x, y)]):
             for i, j in self.__neighbours(x, y):
                 if self.cells[i][j] == CellStatus.Unknown:
-                    if not self.open(i, j):
-                        return False
-        return True
+                    alive, opened = self.open(i, j, True)
+                    changed += opened
+                    if not alive:
+                        return (False, changed) if with_changes else False
+        return (True, changed) if with_changes else True
 
     def is_win(self):
-        for i in range(self.boardInfo.Width):
-            for j in range(self.boardInfo.Height):
-                if not self.__mines[i][j] and self.cells[i][j].value >= 9:
-                    return False
-        return True
+        if self.check_counters:
+            self.__check_counters()
+        return self.__openedCount == self.boardInfo.Width * self.boardInfo.Height - self.__mineCount
 
     @property
     def remain_mines(self):
-        return self.__mineCount - sum([1 if cell == CellStatus.Flagged else 0 for col in self.cells for cell in col])
+        if self.check_counters:
+            self.__check_counters()
+        return self.__mineCount - self.__flagCount
+
+    def __check_counters(self):
+        '全盘扫描, 校验已点开的格子数和标旗数'
+        opened = sum([1 if cell.value < 9 else 0 for col in self.cells for cell in col])
+        flags = sum([1 if cell == CellStatus.Flagged else 0 for col in self.cells for cell in col])
+        assert opened == self.__openedCount, '已点开格子数 {} 与计数 {} 不一致'.format(opened, self.__openedCount)
+        assert flags == self.__flagCount, '标旗数 {} 与计数 {} 不一致'.format(flags, self.__flagCount)
 
     def __neighbours(self, x, y):
-        '生成邻居列表'
-        return [ 
-            (i, j)
-            for i in range(max(0, x-1), min(self.boardInfo.Width, x+2))
-                for j in range(max(0, y-1), min(self.boardInfo.Height, y+2))
-        ]
+        '邻居列表(含自身), 取自共用的 BoardGeometry'
+        return self.__geometry.around[x][y]
 
     def show(self, cells = None):
         s=''
@@ -370,5 +670,6 @@ class Minesweeper(MinesweeperOperator, MinesweeperGenerator, MinesweeperSaver):
         assert all([isinstance(cell, bool) for col in mines for cell in col])
         assert self.__mines is None
         self.__mines = mines
+        self.__calculate_numbers()
         self.__calculate_3BV()
         self.__mineCount = sum([1 if cell else 0 for col in mines for cell in col])
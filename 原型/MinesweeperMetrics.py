@@ -0,0 +1,152 @@
+'''
+求解器的结构化计时与统计
+
+每次调用求解器的 run 生成一条记录(dict), 交给当前的输出端(sink):
+    solver:     求解器类名
+    time:       这次调用的总时间(秒)
+    phases:     各阶段的时间, {阶段名: 秒}, 按阶段的先后排列
+    flags/spaces: 确定的雷和空白的个数
+    以及求解器给出的其他字段, 例如 nodes(穷举节点数)、pruned(剪枝数)、frontier(边界格子数)、
+    interior(内部格子数)、components(各组的格子数)、cache_hits/cache_misses(置换表命中数)、
+    complete(是否在时间内完成)、guess(是否为猜测)
+    set_context 设置的字段(例如局的随机种子)会加在每条记录中.
+
+没有设置输出端时 begin_call 返回一个什么都不做的共用对象, 每次调用只多几次空的方法调用.
+'''
+import time
+from contextlib import contextmanager
+
+_sink = None
+_context = {}
+
+class MemorySink:
+    '把记录保存在 records 中'
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+class JsonlSink:
+    '把记录追加到文件中, 每行一条 JSON'
+    def __init__(self, path):
+        self.__file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        import json
+        self.__file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+def set_sink(sink):
+    '''
+    设置输出端, None为关闭
+
+    返回值:
+        原来的输出端
+    '''
+    global _sink
+    old, _sink = _sink, sink
+    return old
+
+@contextmanager
+def use_sink(sink):
+    '''
+    在 with 块中使用输出端 sink(None为关闭), 退出时(包括异常时)恢复原来的输出端并关闭 sink
+
+    返回值:
+        sink
+    '''
+    old = set_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_sink(old)
+        if sink is not None:
+            sink.close()
+
+def get_sink():
+    return _sink
+
+def set_context(**fields):
+    '设置之后每条记录都带有的字段, 值为None的字段被删除'
+    for key, value in fields.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = value
+
+class CallRecord:
+    '''
+    一次求解器调用的记录
+
+    phase(name) 结束名为name的阶段(从上一个阶段结束或开始时算起),
+    set(...) 设置字段, finish(flags, spaces) 写入输出端.
+    debug_print 为True时每个阶段结束及 finish 时打印出来.
+    '''
+    def __init__(self, solver, debug_print = False):
+        self.__start = self.__last = time.perf_counter()
+        self.__debug_print = debug_print
+        self.record = {'solver': type(solver).__name__, 'time': 0.0, 'phases': {}}
+
+    def phase(self, name):
+        now = time.perf_counter()
+        elapsed, self.__last = now - self.__last, now
+        phases = self.record['phases']
+        phases[name] = phases.get(name, 0.0) + elapsed
+        if self.__debug_print:
+            print(f'{name} time: {elapsed}s')
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def finish(self, flags, spaces):
+        self.record['time'] = time.perf_counter() - self.__start
+        self.record['flags'] = len(flags)
+        self.record['spaces'] = len(spaces)
+        self.record.update(_context)
+        if self.__debug_print:
+            print(', '.join([f'{key}: {value}' for key, value in self.record.items() if key != 'phases']))
+        if _sink is not None:
+            _sink.write(self.record)
+
+class _NullRecord:
+    '没有输出端时使用, 什么都不做'
+    def phase(self, name):
+        pass
+
+    def set(self, **fields):
+        pass
+
+    def finish(self, flags, spaces):
+        pass
+
+_NULL_RECORD = _NullRecord()
+
+def begin_call(solver, debug_print = False):
+    '开始记录一次求解器调用; 没有输出端且不打印时返回共用的空记录'
+    if _sink is None and not debug_print:
+        return _NULL_RECORD
+    return CallRecord(solver, debug_print)
+
+def summarize(records):
+    '''
+    按求解器汇总记录
+
+    返回值:
+        {求解器: {'calls', 'time', 'nodes', 'phases': {阶段: 总时间}}}
+    '''
+    summary = {}
+    for record in records:
+        s = summary.setdefault(record['solver'], {'calls': 0, 'time': 0.0, 'nodes': 0, 'phases': {}})
+        s['calls'] += 1
+        s['time'] += record['time']
+        s['nodes'] += record.get('nodes', 0)
+        for name, t in record['phases'].items():
+            s['phases'][name] = s['phases'].get(name, 0.0) + t
+    return summary
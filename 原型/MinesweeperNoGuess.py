@@ -0,0 +1,397 @@
+'''
+无猜棋盘的生成
+
+从第一次点击开始只用推导(单个数字、两个数字的组合、线性消元加剩余雷数)就能点开所有非雷格子的棋盘.
+推导卡住时不重新生成整个棋盘, 而是把卡住的边界上的一个雷移到别处:
+    移出的雷 q 取自与已点开格子相邻的未知格子, 移入的格子 r 优先取不与已点开格子相邻的未知格子,
+    没有这样的格子时取q周围以外的任意非雷格子(可能已点开)
+    只有在 q 或 r 周围的格子第一次点开之前的推导不受这次移动的影响,
+    所以回退到这之前的状态继续推导, 而不是从第一次点击重新开始
+移动次数超过上限时才重新生成整个棋盘, 重新生成的次数也有上限, 达到时抛出 NoGuessError.
+这样生成的棋盘中, 雷比随机棋盘更倾向于分布在推导较晚到达的区域.
+格子的下标与位棋盘相同, 第 x 列第 y 行为 x * Height + y.
+'''
+import random
+from MinesweeperGenerate import BoardInfo, MineCountError, board_geometry
+from MinesweeperSolver import linear_deduce
+
+# 生成一个棋盘时默认最多重新生成的次数
+MAX_RESTARTS = 100
+
+class NoGuessError(Exception):
+    '''
+    异常:
+        重新生成的次数达到上限仍没有得到无猜棋盘, 通常是雷太密
+    '''
+    def __init__(self, msg):
+        self.message = msg
+
+    def __str__(self):
+        return self.message
+
+class _Deducer:
+    '''
+    在已知雷分布的棋盘上模拟只推导不猜的玩家
+
+    状态: 0为未知, 1为已点开, 2为已标旗
+    log 按先后记录点开和标旗的格子, order[p] 为格子p在 log 中的位置(未知格子为-1), 用于回退
+    border 为已点开的数字中可能还有未知邻居的, 没有时在 frontier 中去掉
+    单个数字和两个数字组合的检测都只针对周围有变化的数字
+    '''
+    def __init__(self, geometry, mines, counts, mineCount):
+        self.__around = geometry.around_index
+        self.__around5 = geometry.window_index(2, False)
+        self.__mines = mines
+        self.__counts = counts
+        self.__mineCount = mineCount
+        self.state = bytearray(geometry.Size)
+        self.order = [-1] * geometry.Size
+        self.log = []
+        self.__remainSafe = geometry.Size - mineCount
+        self.__flagCount = 0
+        self.__border = set()
+        self.__dirty = set()
+        self.__pairDirty = set()
+
+    @property
+    def solved(self):
+        return self.__remainSafe == 0
+
+    def __touch(self, p):
+        '格子p变化后, 周围已点开的数字需要重新检测'
+        state = self.state
+        changed = [q for q in self.__around[p] if state[q] == 1]
+        self.__dirty.update(changed)
+        self.__pairDirty.update(changed)
+
+    def open(self, p):
+        '点开格子p, 空白自动展开'
+        state = self.state
+        if state[p] != 0:
+            return
+        assert not self.__mines[p]
+        stack = [p]
+        while stack:
+            c = stack.pop()
+            if state[c] != 0:
+                continue
+            state[c] = 1
+            self.order[c] = len(self.log)
+            self.log.append(c)
+            self.__remainSafe -= 1
+            self.__touch(c)
+            if self.__counts[c] == 0:
+                stack += [q for q in self.__around[c] if state[q] == 0]
+            else:
+                self.__border.add(c)
+
+    def flag(self, p):
+        if self.state[p] != 0:
+            return
+        assert self.__mines[p]
+        self.state[p] = 2
+        self.order[p] = len(self.log)
+        self.log.append(p)
+        self.__flagCount += 1
+        self.__touch(p)
+
+    def rollback(self, t):
+        '回退到 log 中第t项之前的状态'
+        state = self.state
+        for p in self.log[t:]:
+            if state[p] == 1:
+                self.__remainSafe += 1
+            else:
+                self.__flagCount -= 1
+            state[p] = 0
+            self.order[p] = -1
+        del self.log[t:]
+        around = self.__around
+        # 回退可能截断空白的展开, 所以空白也要重新检测
+        self.__dirty = set([p for p in self.log if state[p] == 1 and any([state[q] == 0 for q in around[p]])])
+        self.__border = set([p for p in self.__dirty if self.__counts[p] > 0])
+        self.__pairDirty = set(self.__border)
+
+    def frontier(self):
+        '已点开的数字及其周围的未知格子与还需要的雷数, {数字: (未知格子的集合, 雷数)}'
+        result = {}
+        for p in list(self.__border):
+            info = self.__info(p)
+            if info is None:
+                self.__border.discard(p)
+            else:
+                result[p] = info
+        return result
+
+    def __info(self, p):
+        '已点开的数字p周围的未知格子与还需要的雷数, 不是数字或没有未知格子时为None'
+        state = self.state
+        if state[p] != 1 or self.__counts[p] == 0:
+            return None
+        unknown = [q for q in self.__around[p] if state[q] == 0]
+        if not unknown:
+            return None
+        return (set(unknown), self.__counts[p] - sum([1 for q in self.__around[p] if state[q] == 2]))
+
+    def solve(self):
+        '''
+        推导到不能再推导为止
+
+        返回值:
+            是否点开了所有非雷格子
+        '''
+        while not self.solved:
+            if self.__basic():
+                continue
+            if self.__pairs():
+                continue
+            if self.__linear():
+                continue
+            break
+        return self.solved
+
+    def __apply(self, flags, spaces):
+        for p in flags:
+            self.flag(p)
+        for p in spaces:
+            self.open(p)
+        return len(flags) + len(spaces) > 0
+
+    def __basic(self):
+        '单个数字: 周围的雷已经标完时点开其余格子, 未知格子数等于还需要的雷数时全部标旗'
+        state = self.state
+        around = self.__around
+        found = False
+        while self.__dirty:
+            c = self.__dirty.pop()
+            unknown = [q for q in around[c] if state[q] == 0]
+            if not unknown:
+                continue
+            need = self.__counts[c] - sum([1 for q in around[c] if state[q] == 2])
+            if need == 0:
+                found = self.__apply((), unknown) or found
+            elif need == len(unknown):
+                found = self.__apply(unknown, ()) or found
+        return found
+
+    def __pairs(self):
+        '''
+        两个数字的组合: 数字a还需要的雷数减去数字b的, 等于只在a周围的未知格子数时,
+        只在a周围的格子都是雷, 只在b周围的格子都是空白
+        只检测至少有一个数字在上次检测之后周围有变化的组合
+        '''
+        infos = {}
+        def info(p):
+            if p not in infos:
+                infos[p] = self.__info(p)
+            return infos[p]
+        while self.__pairDirty:
+            c = self.__pairDirty.pop()
+            infoC = info(c)
+            if infoC is None:
+                continue
+            for b in self.__around5[c]:
+                infoB = info(b)
+                if infoB is None:
+                    continue
+                for (unknownA, needA), (unknownB, needB) in ((infoC, infoB), (infoB, infoC)):
+                    only = unknownA - unknownB
+                    if needA - needB == len(only) and self.__apply(only, unknownB - unknownA):
+                        # c 与其他数字的组合还没有检测完
+                        self.__pairDirty.add(c)
+                        return True
+        return False
+
+    def __linear(self):
+        '所有边界数字和剩余雷数组成的线性方程组, 见 MinesweeperSolver.linear_deduce'
+        rows = [({q: 1 for q in unknown}, need) for unknown, need in self.frontier().values()]
+        unknowns = [p for p in range(len(self.state)) if self.state[p] == 0]
+        rows.append(({p: 1 for p in unknowns}, self.__mineCount - self.__flagCount))
+        ones, zeros = linear_deduce(rows)
+        return self.__apply(sorted(ones), sorted(zeros))
+
+class NoGuessGenerator:
+    '''
+    无猜棋盘生成器
+
+    同一个生成器可以连续生成多个同样大小、同样雷数的棋盘, 并累计统计:
+        boards: 生成的棋盘数
+        attempts: 推导的次数(每个新生成的随机棋盘一次, 每次移动雷一次)
+        repairs: 移动雷的次数
+        restarts: 移动次数超过上限后重新生成整个棋盘的次数
+    '''
+    def __init__(self, width, height, mineCount, max_repairs = None, seed = None, max_restarts = MAX_RESTARTS):
+        '''
+        参数:
+            width: 宽
+            height: 高
+            mineCount: 雷数
+            max_repairs: 每个随机棋盘最多移动雷的次数, None为雷数
+            seed: 随机种子, 相同的种子生成相同的棋盘序列
+            max_restarts: 生成一个棋盘时最多重新生成整个棋盘的次数, None为不限
+
+        异常:
+            MineCountError
+        '''
+        self.boardInfo = BoardInfo(width, height)
+        if mineCount < 1:
+            raise MineCountError('雷数小于1')
+        elif mineCount > self.boardInfo.MaxMineCount:
+            raise MineCountError('雷数大于{}'.format(self.boardInfo.MaxMineCount))
+        self.mineCount = mineCount
+        self.max_repairs = mineCount if max_repairs is None else max_repairs
+        self.max_restarts = max_restarts
+        self.boards = 0
+        self.attempts = 0
+        self.repairs = 0
+        self.restarts = 0
+        self.__geometry = board_geometry(width, height)
+        self.__random = random.Random(seed)
+
+    def generate(self, x, y):
+        '''
+        生成一个从 (x, y) 点开后无需猜测的棋盘, (x, y) 周围3×3的格子没有雷
+
+        返回值:
+            雷的分布, list[list[bool]]
+
+        异常:
+            XYCheckError
+            NoGuessError: 重新生成了 max_restarts 次仍没有得到无猜棋盘
+        '''
+        self.boardInfo.xycheck(x, y)
+        geometry = self.__geometry
+        start = geometry.index(x, y)
+        restart = 0
+        while True:
+            mines = self.__random_mines(start)
+            if self.__repair(mines, start):
+                self.boards += 1
+                height = geometry.Height
+                return [mines[i * height:(i + 1) * height] for i in range(geometry.Width)]
+            if self.max_restarts is not None and restart >= self.max_restarts:
+                raise NoGuessError(f'重新生成{restart}次仍没有得到无猜棋盘({geometry.Width}×{geometry.Height}, {self.mineCount}个雷)')
+            restart += 1
+            self.restarts += 1
+
+    def __random_mines(self, start):
+        safe = set(self.__geometry.around_index[start])
+        free = [p for p in range(self.__geometry.Size) if p not in safe]
+        mines = [False] * self.__geometry.Size
+        for p in self.__random.sample(free, self.mineCount):
+            mines[p] = True
+        return mines
+
+    def __repair(self, mines, start):
+        '''
+        推导, 卡住时把边界上的一个雷移走后回退继续推导
+
+        返回值:
+            是否在 max_repairs 次移动内得到无猜棋盘, mines 被修改为这个棋盘
+        '''
+        around = self.__geometry.around_index
+        counts = [0] * self.__geometry.Size
+        for p in range(self.__geometry.Size):
+            if mines[p]:
+                for q in around[p]:
+                    counts[q] += 1
+        deducer = _Deducer(self.__geometry, mines, counts, self.mineCount)
+        deducer.open(start)
+        for repair in range(self.max_repairs + 1):
+            self.attempts += 1
+            if deducer.solve():
+                return True
+            if repair == self.max_repairs:
+                break
+            state = deducer.state
+            near = bytearray(len(state))
+            for p in deducer.log:
+                if state[p] == 1:
+                    for q in around[p]:
+                        near[q] = 1
+            stuck = [p for p in range(len(state)) if state[p] == 0 and near[p] and mines[p]]
+            if not stuck:
+                # 剩下的未知区域被雷围住, 没有边界
+                stuck = [p for p in range(len(state)) if state[p] == 0 and mines[p]]
+            targets = [p for p in range(len(state)) if state[p] == 0 and not near[p] and not mines[p]]
+            q = self.__random.choice(stuck)
+            if not targets:
+                # 未知格子都在边界上, 在其中移动往往只是换成对称的局面, 改为移到q周围以外的任意非雷格子(包括已点开的)
+                excluded = set(around[start] + around[q])
+                targets = [p for p in range(len(state)) if not mines[p] and p not in excluded]
+                if not targets:
+                    break
+            r = self.__random.choice(targets)
+            self.repairs += 1
+            t = min([deducer.order[p] for p in around[q] + around[r] if state[p] == 1], default=len(deducer.log))
+            deducer.rollback(t)
+            mines[q], mines[r] = False, True
+            for p in around[q]:
+                counts[p] -= 1
+            for p in around[r]:
+                counts[p] += 1
+        return False
+
+def generate_no_guess(msOp, mineCount, x, y, seed = None, max_repairs = None, max_restarts = MAX_RESTARTS):
+    '''
+    用 NoGuessGenerator 为还没有雷的棋盘(Minesweeper 或 MinesweeperBitboard)设置无猜的雷
+
+    参数:
+        msOp: 棋盘, 其大小决定生成的棋盘大小
+        其他参数与 NoGuessGenerator 相同
+
+    返回值:
+        所用的 NoGuessGenerator, 可以从中读取统计
+    '''
+    generator = NoGuessGenerator(msOp.boardInfo.Width, msOp.boardInfo.Height, mineCount, max_repairs, seed, max_restarts)
+    msOp.mines = generator.generate(x, y)
+    return generator
+
+def main():
+    import argparse
+    from time import perf_counter
+    parser = argparse.ArgumentParser(description='generate no-guess boards and measure the generation speed')
+    parser.add_argument('width', type=int, help='width of minesweeper board')
+    parser.add_argument('height', type=int, help='height of minesweeper board')
+    parser.add_argument('mineCount', type=int, help='mine count of minesweeper board')
+    parser.add_argument('-n', '--boards', type=int, default=100, help='number of boards (default: 100)')
+    parser.add_argument('--startx', type=int, default=None, help='col for the first click (default: center)')
+    parser.add_argument('--starty', type=int, default=None, help='row for the first click (default: center)')
+    parser.add_argument('--max_repairs', type=int, default=None, help='mine moves before a board is discarded (default: mine count)')
+    parser.add_argument('--max_restarts', type=int, default=MAX_RESTARTS, help=f'new random boards per generated board before giving up (default: {MAX_RESTARTS})')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--verify', action='store_true', default=False, help='play every board with the session solver and count guesses')
+    args = parser.parse_args()
+
+    startx = args.width // 2 if args.startx is None else args.startx
+    starty = args.height // 2 if args.starty is None else args.starty
+    generator = NoGuessGenerator(args.width, args.height, args.mineCount, args.max_repairs, args.seed, args.max_restarts)
+    boards = []
+    start = perf_counter()
+    for _ in range(args.boards):
+        boards.append(generator.generate(startx, starty))
+    use_time = perf_counter() - start
+    print(f'boards: {generator.boards}, time: {use_time:.3f}s, {generator.boards / use_time:.2f} boards/s')
+    print(f'attempts per board: {generator.attempts / generator.boards:.2f}, repairs per board: {generator.repairs / generator.boards:.2f}, restarts per board: {generator.restarts / generator.boards:.3f}')
+    if args.verify:
+        from MinesweeperGenerate import Minesweeper
+        from MinesweeperSolver import MinesweeperSolverSession
+        guessed = 0
+        for mines in boards:
+            ms = Minesweeper(args.width, args.height)
+            ms.mines = mines
+            ms.open(startx, starty)
+            session = MinesweeperSolverSession(ms)
+            while not ms.is_win():
+                toFlags, toSpaces = session.run()
+                if session.is_guess:
+                    guessed += 1
+                    break
+                for x, y in toFlags:
+                    ms.flag(x, y)
+                for x, y in toSpaces:
+                    ms.open(x, y)
+        print(f'boards needing a guess: {guessed}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+'''
+用 NumPy 批量生成棋盘、计算数字平面
+
+numpy 是可选的依赖: 没有安装时导入本模块不会出错, 调用其中的函数时抛出 ImportError.
+棋盘为 bool 数组, 形状为 (宽, 高), 下标与 list[list[bool]] 的 mines[x][y] 相同,
+展平后第 x 列第 y 行为第 x * 高 + y 个, 与位棋盘相同; 一次生成 K 个棋盘时形状为 (K, 宽, 高).
+'''
+from MinesweeperGenerate import BoardInfo, MineCountError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('需要安装 numpy')
+
+def safe_zone(width, height, x, y):
+    '初始点击点周围3×3的格子为True的 (宽, 高) bool 数组'
+    _require_numpy()
+    zone = np.zeros((width, height), dtype=bool)
+    zone[max(0, x-1):x+2, max(0, y-1):y+2] = True
+    return zone
+
+def generate_mines(width, height, mineCount, x, y, count = None, seed = None):
+    '''
+    随机生成雷的分布, 初始点击点周围3×3的格子没有雷
+
+    每个棋盘给每个可以放雷的格子一个随机数, 最小的 mineCount 个格子放雷,
+    K 个棋盘只需一次生成随机数和一次 argpartition.
+
+    参数:
+        width: 宽
+        height: 高
+        mineCount: 雷数
+        x: 初始点击点的横坐标 ∈[0,Width)
+        y: 初始点击点的纵坐标 ∈[0,Height)
+        count: 生成的棋盘数, None为只生成一个
+        seed: 随机种子或 numpy.random.Generator, 相同的种子生成相同的棋盘
+
+    返回值:
+        bool 数组, 形状为 (宽, 高); count 不为None时为 (count, 宽, 高)
+
+    异常:
+        MineCountError
+        XYCheckError
+    '''
+    _require_numpy()
+    BoardInfo(width, height).xycheck(x, y)
+    free = np.flatnonzero(~safe_zone(width, height, x, y).ravel())
+    if mineCount < 1:
+        raise MineCountError('雷数小于1')
+    elif mineCount > len(free):
+        raise MineCountError('雷数大于{}'.format(len(free)))
+    rng = np.random.default_rng(seed)
+    k = 1 if count is None else count
+    keys = rng.random((k, len(free)), dtype=np.float32)
+    chosen = np.argpartition(keys, mineCount - 1, axis=1)[:, :mineCount]
+    boards = np.zeros((k, width * height), dtype=bool)
+    np.put_along_axis(boards, free[chosen], True, axis=1)
+    boards = boards.reshape(k, width, height)
+    return boards[0] if count is None else boards
+
+def number_plane(mines):
+    '''
+    每格周围(3×3范围内, 不含自身)的雷数, 由8个平移后的切片相加得到
+
+    参数:
+        mines: bool 数组, 形状为 (..., 宽, 高)
+
+    返回值:
+        uint8 数组, 形状与 mines 相同
+    '''
+    _require_numpy()
+    width, height = mines.shape[-2:]
+    padded = np.pad(mines.astype(np.uint8), [(0, 0)] * (mines.ndim - 2) + [(1, 1), (1, 1)])
+    numbers = np.zeros(mines.shape, dtype=np.uint8)
+    for dx in range(3):
+        for dy in range(3):
+            if dx != 1 or dy != 1:
+                numbers += padded[..., dx:dx + width, dy:dy + height]
+    return numbers
+
+def generate_board(msOp, mineCount, x, y, seed = None):
+    '''
+    用 generate_mines 为还没有雷的棋盘(Minesweeper 或 MinesweeperBitboard)设置雷
+
+    参数:
+        msOp: 棋盘, 其大小决定生成的棋盘大小
+        其他参数与 generate_mines 相同
+    '''
+    mines = generate_mines(msOp.boardInfo.Width, msOp.boardInfo.Height, mineCount, x, y, seed=seed)
+    msOp.mines = mines.tolist()
+
+def main():
+    import argparse
+    from time import perf_counter
+    parser = argparse.ArgumentParser(description='measure bulk board generation with numpy')
+    parser.add_argument('width', type=int, help='width of minesweeper board')
+    parser.add_argument('height', type=int, help='height of minesweeper board')
+    parser.add_argument('mineCount', type=int, help='mine count of minesweeper board')
+    parser.add_argument('-k', '--count', type=int, default=10000, help='boards generated at once (default: 10000)')
+    parser.add_argument('-n', '--batches', type=int, default=10, help='number of batches (default: 10)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    args = parser.parse_args()
+
+    _require_numpy()
+    rng = np.random.default_rng(args.seed)
+    startx, starty = args.width // 2, args.height // 2
+    start = perf_counter()
+    for _ in range(args.batches):
+        mines = generate_mines(args.width, args.height, args.mineCount, startx, starty, args.count, rng)
+        number_plane(mines)
+    use_time = perf_counter() - start
+    boards = args.count * args.batches
+    print(f'boards: {boards}, time: {use_time:.3f}s, {boards / use_time:.0f} boards/s, {boards / use_time * 60 / 1e6:.2f}M boards/min')
+
+if __name__ == "__main__":
+    main()
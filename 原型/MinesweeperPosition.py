@@ -0,0 +1,82 @@
+from MinesweeperGenerate import BoardInfo, BoardView, CellStatus, MinesweeperOperator, ReadOnlyError
+
+_CHARS = '.12345678@F'
+
+class MinesweeperPosition(MinesweeperOperator):
+    '''
+    保存下来的局面, 只能读取, 用于测试和对比求解器; open/flag/open_final 抛出 ReadOnlyError
+
+    文件格式(文本, utf-8):
+        以#开头的行为注释
+        第一个非注释行: 剩余雷数
+        之后每行为一列(与 Minesweeper.show 的输出相同):
+            '.'为空白, '1'~'8'为数字, '@'为未点开, 'F'为已标旗
+    '''
+    def __init__(self, cells, remainMines, name = None):
+        self.boardInfo = BoardInfo(len(cells), len(cells[0]))
+        assert all([len(col) == self.boardInfo.Height for col in cells])
+        self.cells = [list(col) for col in cells]
+        self.__view = BoardView([tuple(col) for col in cells])
+        self.name = name
+        self.__remain_mines = remainMines
+
+    @staticmethod
+    def from_operator(msOp: MinesweeperOperator, name = None):
+        '保存一个棋盘当前的局面'
+        return MinesweeperPosition(msOp.cells_view, msOp.remain_mines, name)
+
+    @staticmethod
+    def load(path):
+        import os
+        with open(path, encoding='utf-8') as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        cells = [[CellStatus(_CHARS.index(c)) for c in line] for line in lines[1:]]
+        return MinesweeperPosition(cells, int(lines[0]), os.path.splitext(os.path.basename(path))[0])
+
+    def save(self, path, comment = None):
+        with open(path, 'w', encoding='utf-8') as f:
+            if comment is not None:
+                f.write('# {}\n'.format(comment))
+            f.write('{}\n'.format(self.__remain_mines))
+            for col in self.cells:
+                f.write(''.join([_CHARS[cell.value] for cell in col]) + '\n')
+
+    @property
+    def all_cells(self):
+        return self.__view.copy()
+
+    @property
+    def cells_view(self):
+        return self.__view
+
+    def open(self, x, y, with_changes = False):
+        raise ReadOnlyError('局面只读')
+
+    def flag(self, x, y, with_changes = False):
+        raise ReadOnlyError('局面只读')
+
+    def open_final(self, x, y, with_changes = False):
+        raise ReadOnlyError('局面只读')
+
+    def is_win(self):
+        return False
+
+    @property
+    def remain_mines(self):
+        return self.__remain_mines
+
+def load_positions(paths):
+    '''
+    读取局面文件, paths中的目录会读取其中所有的 .txt 文件
+
+    返回值:
+        list[MinesweeperPosition], 按文件名排序
+    '''
+    import os
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in os.listdir(path) if name.endswith('.txt')]
+        else:
+            files.append(path)
+    return [MinesweeperPosition.load(path) for path in sorted(files)]
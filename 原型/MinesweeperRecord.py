@@ -0,0 +1,211 @@
+'''
+对局记录的二进制格式(小端):
+
+    文件头:    b'MSRC', 版本(u16), 保留(u16)
+    每一局:
+        局头:  宽(u16), 高(u16), 雷数(u32)
+        雷图:  ceil(宽 * 高 / 8) 字节, 第 x 列第 y 行的格子对应第 x * 高 + y 位
+        操作:  每条5字节, 类型(u8), x(u16), y(u16)
+        局尾:  类型为0的操作
+
+一局的长度由局尾标记确定, 所以写入时只需不断追加, 不需要回头修改;
+多局依次追加在同一个文件中即为存档.
+'''
+import struct
+
+MAGIC = b'MSRC'
+VERSION = 1
+
+OP_END = 0
+OP_OPEN = 1
+OP_FLAG = 2
+OP_OPEN_FINAL = 3
+
+_FILE_HEADER = struct.Struct('<4sHH')
+_GAME_HEADER = struct.Struct('<HHI')
+_OP = struct.Struct('<BHH')
+
+class RecordFormatError(Exception):
+    '''
+    异常:
+        对局记录文件格式不正确
+    '''
+    def __init__(self, msg):
+        self.message = msg
+
+class GameRecord:
+    '''
+    一局的记录
+
+    参数:
+        width: 宽
+        height: 高
+        mineCount: 雷数
+        bitmap: 压缩后的雷图, bytes
+        ops: 操作, list[(类型, x, y)]
+    '''
+    def __init__(self, width, height, mineCount, bitmap, ops):
+        assert len(bitmap) == (width * height + 7) // 8
+        self.width = width
+        self.height = height
+        self.mineCount = mineCount
+        self.bitmap = bitmap
+        self.ops = ops
+
+    @staticmethod
+    def from_mines(mines, ops):
+        '由 list[list[bool]] 的雷分布生成记录'
+        bitmap = pack_mines(mines)
+        return GameRecord(len(mines), len(mines[0]), sum([col.count(True) for col in mines]), bitmap, ops)
+
+    @property
+    def mines(self):
+        '雷的分布, list[list[bool]]'
+        return unpack_mines(self.bitmap, self.width, self.height)
+
+def pack_mines(mines):
+    '把 list[list[bool]] 压成雷图'
+    size = len(mines) * len(mines[0])
+    bits = ''.join(['1' if cell else '0' for col in mines for cell in col])
+    return int(bits[::-1], 2).to_bytes((size + 7) // 8, 'little')
+
+def unpack_mines(bitmap, width, height):
+    '把雷图展开成 list[list[bool]]'
+    bits = format(int.from_bytes(bitmap, 'little'), '0{}b'.format(len(bitmap) * 8))[::-1]
+    return [[bits[x * height + y] == '1' for y in range(height)] for x in range(width)]
+
+def is_record_file(path):
+    '文件是否为二进制对局记录(而非旧的pickle记录), 空文件(例如写入前被中断)为没有对局的记录'
+    with open(path, 'rb') as f:
+        data = f.read(len(MAGIC))
+    return len(data) == 0 or data == MAGIC
+
+def check_record_target(path, append = True):
+    '''
+    在写入之前检查目标文件: 追加时已有的非空文件必须是对局记录
+
+    异常:
+        RecordFormatError
+    '''
+    import os
+    if append and os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            _check_header(f.read(_FILE_HEADER.size))
+
+class GameRecordWriter:
+    '''
+    对局记录的写入器
+
+    append为True时, 文件不存在或为空时写入文件头, 否则检查文件头后在末尾追加;
+    append为False时清空文件重新写入.
+    可以用 write_game 一次写入一局, 也可以用 begin_game/append_op/end_game 边玩边写.
+    '''
+    def __init__(self, path, append = True):
+        import os
+        check_record_target(path, append)
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.__file = open(path, 'ab')
+        else:
+            self.__file = open(path, 'wb')
+            self.__file.write(_FILE_HEADER.pack(MAGIC, VERSION, 0))
+        self.__in_game = False
+
+    def begin_game(self, width, height, mineCount, bitmap):
+        assert not self.__in_game
+        assert len(bitmap) == (width * height + 7) // 8
+        self.__file.write(_GAME_HEADER.pack(width, height, mineCount) + bitmap)
+        self.__in_game = True
+
+    def append_op(self, opType, x, y):
+        assert self.__in_game and opType != OP_END
+        self.__file.write(_OP.pack(opType, x, y))
+
+    def end_game(self):
+        assert self.__in_game
+        self.__file.write(_OP.pack(OP_END, 0, 0))
+        self.__file.flush()
+        self.__in_game = False
+
+    def write_game(self, record: GameRecord):
+        self.begin_game(record.width, record.height, record.mineCount, record.bitmap)
+        self.__file.write(b''.join([_OP.pack(*op) for op in record.ops]))
+        self.end_game()
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class GameRecordArchive:
+    '''
+    以内存映射方式读取的对局记录存档
+
+    打开时只扫描一遍得到每局的位置, 每局的内容在访问时才解析.
+    空文件为没有对局的存档(与 is_record_file 一致).
+    '''
+    def __init__(self, path):
+        import mmap, os
+        self.__file = open(path, 'rb')
+        self.__offsets = []
+        if os.fstat(self.__file.fileno()).st_size == 0:
+            # 空文件不能做内存映射
+            self.__map = b''
+            return
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_header(self.__map[:_FILE_HEADER.size])
+        pos = _FILE_HEADER.size
+        end = len(self.__map)
+        while pos < end:
+            if pos + _GAME_HEADER.size > end:
+                raise RecordFormatError('记录不完整')
+            width, height, _ = _GAME_HEADER.unpack_from(self.__map, pos)
+            opsPos = pos + _GAME_HEADER.size + (width * height + 7) // 8
+            # 局尾标记为5个0字节, 且操作按5字节对齐
+            p = opsPos
+            while True:
+                p = self.__map.find(b'\0' * _OP.size, p)
+                if p < 0:
+                    raise RecordFormatError('记录不完整')
+                if (p - opsPos) % _OP.size == 0:
+                    break
+                p += 1
+            self.__offsets.append((pos, opsPos, p))
+            pos = p + _OP.size
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __getitem__(self, index):
+        pos, opsPos, endPos = self.__offsets[index]
+        width, height, mineCount = _GAME_HEADER.unpack_from(self.__map, pos)
+        bitmap = self.__map[pos + _GAME_HEADER.size:opsPos]
+        ops = list(_OP.iter_unpack(self.__map[opsPos:endPos]))
+        return GameRecord(width, height, mineCount, bitmap, ops)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        if len(self.__map) > 0:
+            self.__map.close()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _check_header(data):
+    if len(data) < _FILE_HEADER.size:
+        raise RecordFormatError('不是对局记录文件')
+    magic, version, _ = _FILE_HEADER.unpack(data)
+    if magic != MAGIC:
+        raise RecordFormatError('不是对局记录文件')
+    if version > VERSION:
+        raise RecordFormatError('不支持的版本: {}'.format(version))
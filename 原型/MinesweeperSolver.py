@@ -1,6 +1,12 @@
-from MinesweeperGenerate import MinesweeperOperator, CellStatus
+from MinesweeperGenerate import MinesweeperOperator, CellStatus, board_geometry
+from MinesweeperMetrics import begin_call
 from enum import Enum
 from abc import abstractmethod, abstractproperty, ABCMeta
+from functools import lru_cache
+import itertools
+import math
+import os
+import pickle
 import time
 
 class CheckState(Enum):
@@ -9,25 +15,592 @@ class CheckState(Enum):
     space = 2
     flag_or_space = 3
 
+# 组合数缓存的最大项数, 所有求解器共用, 多次 run 之间也不会重新计算
+BINOMIAL_CACHE_SIZE = 1 << 16
+
+@lru_cache(maxsize=BINOMIAL_CACHE_SIZE)
+def binomial(n, k):
+    '组合数 C(n, k), k 不在 [0, n] 内时为0'
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+@lru_cache(maxsize=BINOMIAL_CACHE_SIZE)
+def log_binomial(n, k):
+    '组合数的自然对数 ln C(n, k), k 不在 [0, n] 内时为None'
+    if not 0 <= k <= n:
+        return None
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+class ConstraintModel:
+    '''
+    数字约束模型
+
+    预先为每个与待定格子相邻的数字记录: 周围的待定格子、还需要的雷数,
+    以及当前已定为雷的格子数和仍未确定的格子数.
+    每次赋值/撤销只更新该格子周围的数字(至多8个)的计数, 冲突立即发现,
+    因赋值而唯一确定的格子也会被连带推出(记录在 trail 中, 撤销时一并恢复).
+    赋值时同时在 cells 中写入 ToFlag/ToSpace 标记.
+    '''
+    def __init__(self, cells, variables):
+        self.__cells = cells
+        self.variables = variables
+        self.values = [None if cells[x][y] == CellStatus.Unknown else 0 for x, y in variables]
+        self.mines = 0
+        self.mine_stack = []
+        self.__trail = []
+        self.__around = board_geometry(len(cells), len(cells[0])).around
+        index = {pos: k for k, pos in enumerate(variables) if self.values[k] is None}
+        self.__var_cons = [[] for _ in variables]
+        self.__need = []
+        self.__free = []
+        self.__con_vars = []
+        self.__assigned = []
+        self.__unassigned = []
+        numbers = set()
+        for x, y in index:
+            for i, j in self.__around[x][y]:
+                if cells[i][j].value < 9 and (i, j) not in numbers:
+                    numbers.add((i, j))
+                    self.__add_constraint(i, j, index)
+
+    def __add_constraint(self, i, j, index):
+        cells = self.__cells
+        need = cells[i][j].value
+        free = 0
+        con_vars = []
+        for ii, jj in self.__around[i][j]:
+            if cells[ii][jj] in [CellStatus.Flagged, CellStatus.ToFlag]:
+                need -= 1
+            elif cells[ii][jj] == CellStatus.Unknown:
+                if (ii, jj) in index:
+                    con_vars.append(index[(ii, jj)])
+                else:
+                    free += 1
+        c = len(self.__need)
+        for v in con_vars:
+            self.__var_cons[v].append(c)
+        self.__need.append(need)
+        self.__free.append(free)
+        self.__con_vars.append(con_vars)
+        self.__assigned.append(0)
+        self.__unassigned.append(len(con_vars))
+
+    @property
+    def constraints(self):
+        '约束列表, 每项为(待定格子下标列表, 还需要的雷数, 不在待定格子中的未知格子数)'
+        return list(zip(self.__con_vars, self.__need, self.__free))
+
+    def var_constraints(self, v):
+        '第v个待定格子所在的约束下标'
+        return self.__var_cons[v]
+
+    @property
+    def constraint_count(self):
+        return len(self.__need)
+
+    def constraint_vars(self, c):
+        '第c个约束中的待定格子下标'
+        return self.__con_vars[c]
+
+    def slack(self, c):
+        '第c个约束还能放几个雷, 以及还剩几个未定格子'
+        return (self.__need[c] - self.__assigned[c], self.__unassigned[c])
+
+    def mark(self):
+        return len(self.__trail)
+
+    def __set(self, v, val):
+        self.values[v] = val
+        self.__trail.append(v)
+        for c in self.__var_cons[v]:
+            self.__unassigned[c] -= 1
+            self.__assigned[c] += val
+        x, y = self.variables[v]
+        if val:
+            self.mines += 1
+            self.mine_stack.append(v)
+            self.__cells[x][y] = CellStatus.ToFlag
+        else:
+            self.__cells[x][y] = CellStatus.ToSpace
+
+    def undo(self, mark):
+        '撤销到mark时的状态'
+        while len(self.__trail) > mark:
+            v = self.__trail.pop()
+            val = self.values[v]
+            self.values[v] = None
+            for c in self.__var_cons[v]:
+                self.__unassigned[c] += 1
+                self.__assigned[c] -= val
+            if val:
+                self.mines -= 1
+                self.mine_stack.pop()
+            x, y = self.variables[v]
+            self.__cells[x][y] = CellStatus.Unknown
+
+    def __propagate(self, queue):
+        while len(queue) > 0:
+            v, val = queue.pop()
+            if self.values[v] is not None:
+                if self.values[v] != val:
+                    return False
+                continue
+            self.__set(v, val)
+            for c in self.__var_cons[v]:
+                need = self.__need[c] - self.__assigned[c]
+                rest = self.__unassigned[c]
+                if need < 0 or need > rest + self.__free[c]:
+                    return False
+                if rest > 0:
+                    if need == 0:
+                        queue += [(u, 0) for u in self.__con_vars[c] if self.values[u] is None]
+                    elif need == rest + self.__free[c]:
+                        queue += [(u, 1) for u in self.__con_vars[c] if self.values[u] is None]
+        return True
+
+    def assign(self, v, val):
+        '给第v个待定格子赋值并推出连带确定的格子, 返回是否无冲突(有冲突时需调用undo)'
+        return self.__propagate([(v, val)])
+
+    def propagate_all(self):
+        '在任何赋值前检查所有约束并推出已确定的格子, 返回是否无冲突'
+        queue = []
+        for c, con_vars in enumerate(self.__con_vars):
+            need = self.__need[c]
+            if need < 0 or need > len(con_vars) + self.__free[c]:
+                return False
+            if need == 0:
+                queue += [(u, 0) for u in con_vars]
+            elif need == len(con_vars) + self.__free[c]:
+                queue += [(u, 1) for u in con_vars]
+        return self.__propagate(queue)
+
+    def check(self, v):
+        '第v个待定格子当前可取的值'
+        state = CheckState.flag_or_space
+        for c in self.__var_cons[v]:
+            need = self.__need[c] - self.__assigned[c]
+            if need == 0:
+                state = CheckState(state.value & CheckState.space.value)
+            if need == self.__unassigned[c] + self.__free[c]:
+                state = CheckState(state.value & CheckState.flag.value)
+        return state
+
+class EnumerationOrder(metaclass=ABCMeta):
+    '''
+    穷举时选择下一个待定格子的策略
+
+    next(model, pos) 返回 (下一个要赋值的格子下标, 新的pos), 全部赋值完时格子下标为None.
+    pos 由调用方逐层传递, 策略可以用它记录扫描位置.
+    '''
+    name = None
+
+    def start(self, model: ConstraintModel):
+        pass
+
+    @abstractmethod
+    def next(self, model: ConstraintModel, pos: int):
+        pass
+
+class RasterOrder(EnumerationOrder):
+    '按待定格子给出的顺序(逐列扫描的顺序)'
+    name = 'raster'
+
+    def next(self, model, pos):
+        values = model.values
+        while pos < len(values) and values[pos] is not None:
+            pos += 1
+        if pos == len(values):
+            return (None, pos)
+        return (pos, pos + 1)
+
+class BfsOrder(RasterOrder):
+    '沿边界广度优先: 共享同一个数字的格子相邻'
+    name = 'bfs'
+
+    def start(self, model):
+        self.__sequence = []
+        visited = [False] * len(model.values)
+        for root in range(len(model.values)):
+            if visited[root]:
+                continue
+            visited[root] = True
+            queue = [root]
+            for v in queue:
+                self.__sequence.append(v)
+                for c in model.var_constraints(v):
+                    for u in model.constraint_vars(c):
+                        if not visited[u]:
+                            visited[u] = True
+                            queue.append(u)
+
+    def next(self, model, pos):
+        values = model.values
+        while pos < len(self.__sequence) and values[self.__sequence[pos]] is not None:
+            pos += 1
+        if pos == len(self.__sequence):
+            return (None, pos)
+        return (self.__sequence[pos], pos + 1)
+
+class MostConstrainedOrder(RasterOrder):
+    '''
+    剩余取法最少的优先: 每一步找剩余组合数 C(未定格子数, 还需雷数) 最小的数字,
+    取其中第一个未定格子; 没有未满足的数字时退化为按顺序扫描
+    '''
+    name = 'mrv'
+
+    def next(self, model, pos):
+        best, bestOptions = None, None
+        for c in range(model.constraint_count):
+            need, rest = model.slack(c)
+            if rest > 0:
+                options = math.comb(rest, need)
+                if bestOptions is None or options < bestOptions:
+                    best, bestOptions = c, options
+        if best is None:
+            return RasterOrder.next(self, model, pos)
+        for v in model.constraint_vars(best):
+            if model.values[v] is None:
+                return (v, pos)
+
+ORDERS = {order.name: order for order in [RasterOrder, BfsOrder, MostConstrainedOrder]}
+
+def make_order(order):
+    '由名字或EnumerationOrder实例得到枚举顺序'
+    if isinstance(order, EnumerationOrder):
+        return order
+    return ORDERS[order]()
+
+class MonteCarloEstimator:
+    '''
+    蒙特卡洛概率估计, 用于边界太大无法穷举的局面
+
+    状态为边界格子的一种满足所有数字的赋值, 权重为内部格子的方案数 C(内部格子数, 剩余雷数 - 边界雷数).
+    每步随机取一个边界格子及其沿约束相邻的至多 block 个格子, 固定其余格子,
+    穷举这一块满足约束的所有赋值并按权重抽取一个(块 Gibbs 采样).
+    每 len(边界) / block 步(约一轮)记录一次样本, 丢弃前 burn_in 轮.
+    置信区间用分批均值估计标准误差(样本之间相关, 不能按独立样本计算),
+    批数达到上限时相邻两批合并, 批的大小翻倍, 所以不需要预先知道样本数.
+
+    参数:
+        cells: 棋盘, 不会被修改
+        variables: 边界格子, list[(x, y)]
+        interior: 内部格子(不与数字相邻的未知格子), list[(x, y)]
+        remainMines: 剩余雷数
+        samples: 最多记录的样本数
+        time_limit: 最长运行时间(秒), None为不限
+        block: 每步重新抽样的格子数
+        burn_in: 丢弃的轮数
+        seed: 随机种子
+    '''
+    BATCHES = 20
+
+    def __init__(self, cells, variables, interior, remainMines, samples=200, time_limit=None, block=16, burn_in=20, seed=None):
+        import random
+        self.__cells = [list(col) for col in cells]
+        self.__variables = variables
+        self.__interior = interior
+        self.__remain_mines = remainMines
+        self.__samples = samples
+        self.__time_limit = time_limit
+        self.__block = block
+        self.__burn_in = burn_in
+        self.__random = random.Random(seed)
+        self.__probability = None
+        self.__interval = None
+        self.__sampleCount = 0
+        self.__stepCount = 0
+
+    @property
+    def probability(self):
+        return self.__probability
+
+    @property
+    def interval(self):
+        '每格为雷概率的95%置信区间 (下界, 上界)'
+        return self.__interval
+
+    @property
+    def sample_count(self):
+        return self.__sampleCount
+
+    @property
+    def step_count(self):
+        return self.__stepCount
+
+    def __weight(self, mines):
+        return binomial(len(self.__interior), self.__remain_mines - mines)
+
+    def __first_solution(self, model, deadline):
+        '带约束传播的深度优先搜索, 值的顺序随机, 得到一个初始状态'
+        order = BfsOrder()
+        order.start(model)
+        frames = []
+        pos = 0
+        while True:
+            if deadline is not None and time.time() > deadline:
+                return None
+            v, nextPos = order.next(model, pos)
+            if v is None:
+                if self.__weight(model.mines) > 0:
+                    return list(model.values)
+            else:
+                vals = [0, 1]
+                self.__random.shuffle(vals)
+                frames.append((model.mark(), v, nextPos, vals))
+            while len(frames) > 0:
+                mark, v, nextPos, vals = frames[-1]
+                model.undo(mark)
+                if len(vals) < 1:
+                    frames.pop()
+                    continue
+                if model.assign(v, vals.pop()) and model.mines <= self.__remain_mines:
+                    pos = nextPos
+                    break
+            else:
+                return None
+
+    def __pick_block(self, var_cons, con_vars):
+        root = self.__random.randrange(len(self.__variables))
+        block = [root]
+        seen = set(block)
+        for v in block:
+            neighbours = [u for c in var_cons[v] for u in con_vars[c] if u not in seen]
+            self.__random.shuffle(neighbours)
+            for u in neighbours:
+                if len(block) >= self.__block:
+                    return block
+                if u not in seen:
+                    seen.add(u)
+                    block.append(u)
+        return block
+
+    def __resample(self, block, x, sums, var_cons, con_vars, needs, frees):
+        '固定块外的格子, 按权重重新抽取块内的赋值'
+        cons = set([c for v in block for c in var_cons[v]])
+        inBlock = set(block)
+        base = {c: sums[c] - sum([x[v] for v in con_vars[c] if v in inBlock]) for c in cons}
+        rest = {c: len([v for v in con_vars[c] if v in inBlock]) for c in cons}
+        outside = sum(x) - sum([x[v] for v in block])
+        solutions = []
+        values = []
+        def walk(k):
+            if k == len(block):
+                solutions.append(list(values))
+                return
+            v = block[k]
+            for val in (0, 1):
+                ok = True
+                for c in var_cons[v]:
+                    rest[c] -= 1
+                    base[c] += val
+                    if base[c] > needs[c] or base[c] + rest[c] + frees[c] < needs[c]:
+                        ok = False
+                if ok:
+                    values.append(val)
+                    walk(k + 1)
+                    values.pop()
+                for c in var_cons[v]:
+                    rest[c] += 1
+                    base[c] -= val
+        walk(0)
+        weights = [self.__weight(outside + sum(s)) for s in solutions]
+        r = self.__random.randrange(sum(weights))
+        for s, w in zip(solutions, weights):
+            if r < w:
+                break
+            r -= w
+        for v, val in zip(block, s):
+            if x[v] != val:
+                for c in var_cons[v]:
+                    sums[c] += val - x[v]
+                x[v] = val
+
+    def run(self):
+        '''
+        采样估计每格为雷的概率
+
+        返回值:
+            是否得到了估计(找不到初始状态或在时间内没有记录到样本时为False)
+        '''
+        start = time.time()
+        deadline = None if self.__time_limit is None else start + self.__time_limit
+        model = ConstraintModel(self.__cells, self.__variables)
+        if not model.propagate_all() or model.mines > self.__remain_mines:
+            return False
+        x = self.__first_solution(model, deadline)
+        if x is None:
+            return False
+        con_vars = [con[0] for con in model.constraints]
+        needs = [con[1] for con in model.constraints]
+        frees = [con[2] for con in model.constraints]
+        var_cons = [model.var_constraints(v) for v in range(len(x))]
+        sums = [sum([x[v] for v in vs]) for vs in con_vars]
+        model.undo(0)
+
+        n = len(x)
+        sweep = max(1, n // self.__block)
+        batches = []
+        batchSize = 1
+        inCount = len(self.__interior)
+        sweeps = 0
+        while self.__sampleCount < self.__samples:
+            for _ in range(sweep):
+                if deadline is not None and time.time() > deadline:
+                    break
+                self.__resample(self.__pick_block(var_cons, con_vars), x, sums, var_cons, con_vars, needs, frees)
+                self.__stepCount += 1
+            else:
+                sweeps += 1
+            if deadline is not None and time.time() > deadline:
+                break
+            if sweeps <= self.__burn_in:
+                continue
+            # 连续的样本放在同一批
+            if self.__sampleCount % batchSize == 0:
+                if len(batches) == 2 * self.BATCHES:
+                    batches = [[a + b for a, b in zip(batches[k], batches[k + 1])] for k in range(0, len(batches), 2)]
+                    batchSize *= 2
+                if self.__sampleCount % batchSize == 0:
+                    batches.append([0] * (n + 1))
+            row = batches[-1]
+            for v, val in enumerate(x):
+                row[v] += val
+            if inCount > 0:
+                row[n] += (self.__remain_mines - sum(x)) / inCount
+            self.__sampleCount += 1
+        if self.__sampleCount < 1:
+            return False
+
+        # 只用满的批估计标准误差
+        full = batches[:self.__sampleCount // batchSize]
+        self.__probability = [[None for _ in range(len(self.__cells[0]))] for _ in range(len(self.__cells))]
+        self.__interval = [[None for _ in range(len(self.__cells[0]))] for _ in range(len(self.__cells))]
+        def put(cells, v):
+            p = sum([row[v] for row in batches]) / self.__sampleCount
+            if len(full) > 1:
+                means = [row[v] / batchSize for row in full]
+                se = math.sqrt(sum([(m - p) ** 2 for m in means]) / (len(full) - 1) / len(full))
+                lo, hi = max(0.0, p - 1.96 * se), min(1.0, p + 1.96 * se)
+                # 所有批都相同(比如从未变过)时标准误差为0, 按三倍法则以批数给出区间
+                if se == 0:
+                    lo, hi = max(0.0, p - 3 / len(full)), min(1.0, p + 3 / len(full))
+            else:
+                lo, hi = 0.0, 1.0
+            for i, j in cells:
+                self.__probability[i][j] = p
+                self.__interval[i][j] = (lo, hi)
+        for v, pos in enumerate(self.__variables):
+            put([pos], v)
+        if inCount > 0:
+            put(self.__interior, n)
+        return True
+
+class SolverTimeout(Exception):
+    '''
+    异常:
+        穷举超过了截止时间, 只用于从递归中退出
+    '''
+
+# 待穷举的格子少于这个数时不用进程池, 串行穷举比分发任务快
+PARALLEL_MIN_FRONTIER = 24
+
+# 子进程中的求解器拷贝及其编号, 同一次求解的任务只反序列化一次
+_worker_solver = (None, None)
+_solver_keys = itertools.count()
+
+def _run_worker(task):
+    '在子进程中调用求解器拷贝的方法, task 为 (求解的编号, 序列化的求解器, 方法名, 参数)'
+    global _worker_solver
+    key, data, name, args = task
+    if _worker_solver[0] != key:
+        _worker_solver = (key, pickle.loads(data))
+    return getattr(_worker_solver[1], name)(*args)
+
 class MinesweeperSaverInterface(metaclass=ABCMeta):
+    '''
+    求解器接口
+
+    run 的 time_limit 为这次求解最长的运行时间(秒), None为不限.
+    到时间时先返回已经确定的雷和空白(可能为空), probability 为到目前为止的估计,
+    is_complete 为False; 返回的确定结果总是正确的.
+    每次 run 的阶段时间和统计交给 MinesweeperMetrics 的输出端, debug_print 为True时打印出来.
+    '''
+    _deadline = None
+    _complete = True
+
     @abstractmethod
-    def run(self, debug_print=False):
+    def run(self, debug_print=False, time_limit=None):
         pass
 
     @abstractproperty
     def is_guess(self):
         pass
 
+    @property
+    def is_complete(self):
+        '上一次 run 是否在时间内完成了全部计算'
+        return self._complete
+
+    def stream(self, time_limit=None):
+        '''
+        逐个给出推出的格子, 每项为 (x, y, CellStatus.ToFlag 或 CellStatus.ToSpace)
+
+        默认在 run 结束后依次给出确定的格子, 猜测的格子不会给出;
+        没有给出任何格子时可以用 probability 选择要猜的格子.
+        '''
+        flags, spaces = self.run(time_limit=time_limit)
+        if self.is_guess:
+            return
+        for x, y in flags:
+            yield (x, y, CellStatus.ToFlag)
+        for x, y in spaces:
+            yield (x, y, CellStatus.ToSpace)
+
+    def _start_clock(self, time_limit):
+        self._deadline = None if time_limit is None else time.time() + time_limit
+        self._complete = True
+
+    def _expired(self):
+        return self._deadline is not None and time.time() > self._deadline
+
 class MinesweeperSolverBase(MinesweeperSaverInterface):
-    def __init__(self, msOp: MinesweeperOperator):
-        self._cells = msOp.all_cells
+    '''
+    穷举求解的基类
+
+    counting为True时不保存每个解的棋盘拷贝,
+    只在每个解处累加各雷数下的解数与每个待穷举格子为雷的解数,
+    内存与解的个数无关.
+
+    计数模式下 workers 大于1或给了 pool 时多进程穷举: 按与串行相同的顺序走前 split_depth 层(默认由 workers 决定),
+    每个子树交给进程池, 各子树的计数相加, 与串行的结果完全相同.
+    pool 为调用方持有的进程池(multiprocessing.Pool), 多次求解共用; 没有时每次求解临时建一个 workers 个进程的进程池.
+    待穷举的格子少于 PARALLEL_MIN_FRONTIER 时总是串行.
+
+    计数模式下 log_space 为True时, 汇总用的内部格子方案数以对数计算,
+    减去最大值后取指数得到浮点权重, 不做大整数乘法; 确定的格子仍按整数解数判断.
+    '''
+    def __init__(self, msOp: MinesweeperOperator, counting=False, order='raster', workers=None, split_depth=None, log_space=False, pool=None):
+        # 穷举时会在棋盘上写入 ToFlag/ToSpace, 需要一份可修改的拷贝
+        self._cells = msOp.cells_view.copy()
         assert all([len(self._cells[0]) == len(self._cells[i]) for i in range(1, len(self._cells))])
         self._width = len(self._cells)
         self._height = len(self._cells[0])
-        self.__remain_mines = msOp.remain_mines
+        self._geometry = board_geometry(self._width, self._height)
+        self._remain_mines = msOp.remain_mines
+        self.__counting = counting
         self.__results = []
-        self.__probability = None
-        self.__runCount = 0
+        # 以下为子类穷举时共用的状态, 子类不另存一份
+        self._counts = []
+        self._cell_counts = []
+        self._model = None
+        self._order = make_order(order)
+        self._probability = None
+        self._runCount = 0
+        self._prunedCount = 0
+        self._workers = workers
+        self._pool = pool
+        self.__split_depth = split_depth
+        self.__log_space = log_space
 
     @property
     def is_guess(self):
@@ -35,7 +608,19 @@ class MinesweeperSolverBase(MinesweeperSaverInterface):
 
     @property
     def probability(self):
-        return self.__probability
+        return self._probability
+
+    @property
+    def order_name(self):
+        return self._order.name
+
+    @property
+    def node_count(self):
+        return self._runCount
+
+    @property
+    def pruned_count(self):
+        return self._prunedCount
 
     @abstractmethod
     def _i2xy(self, index: int):
@@ -53,62 +638,254 @@ class MinesweeperSolverBase(MinesweeperSaverInterface):
     def _in_count(self, count, other: bool):
         pass
 
-    def __run(self, index: int, count):
-        self.__runCount += 1
-        if index > self._size:
-            return
-        if index == self._size:
-            t = self._append_convert(self._cells, count)
-            if t is not None:
-                self.__results.append(t)
+    def _log_in_count(self, count, other: bool):
+        '_in_count 的自然对数, 方案数为0时为None'
+        n = self._in_count(count, other)
+        return math.log(n) if n > 0 else None
+
+    def _accept(self, count):
+        '计数模式下, 剩余count个雷时的解是否有效'
+        return True
+
+    def _interior(self):
+        '计数模式下, 不参与穷举而由_in_count统计的格子'
+        return []
+
+    def __run(self, pos: int):
+        self._runCount += 1
+        if self._runCount & 0xff == 0 and self._expired():
+            raise SolverTimeout()
+        model = self._model
+        index, pos = self._order.next(model, pos)
+        if index is None:
+            count = self._remain_mines - model.mines
+            if not self.__counting:
+                t = self._append_convert(self._cells, count)
+                if t is not None:
+                    self.__results.append(t)
+                # 保存棋盘拷贝的代价较大, 每个解都检查一次
+                if self._expired():
+                    raise SolverTimeout()
+            elif self._accept(count):
+                m = model.mines
+                self._counts[m] += 1
+                for k in model.mine_stack:
+                    self._cell_counts[k][m] += 1
             return
-        x, y = self._i2xy(index)
-        if self._cells[x][y] != CellStatus.Unknown:
-            self.__run(index + 1, count)
+        for val in [1, 0]:
+            if val and model.mines >= self._remain_mines:
+                continue
+            mark = model.mark()
+            if model.assign(index, val) and model.mines <= self._remain_mines:
+                self.__run(pos)
+            else:
+                self._prunedCount += 1
+            model.undo(mark)
+
+    def __split(self, pos: int, depth: int, prefix, tasks):
+        '按与 __run 相同的顺序走 depth 层, 每个子树记为一个任务 (赋值序列, pos); 子树的根节点由子进程计数'
+        model = self._model
+        index, nextPos = self._order.next(model, pos)
+        if depth == 0 or index is None:
+            tasks.append((list(prefix), pos))
             return
-        cs = self._check(x, y)
-        if cs == CheckState.space:
-            t, self._cells[x][y] = self._cells[x][y], CellStatus.ToSpace
-            self.__run(index + 1, count)
-            self._cells[x][y] = t
-        elif cs == CheckState.flag:
-            if count > 0:
-                t, self._cells[x][y] = self._cells[x][y], CellStatus.ToFlag
-                self.__run(index + 1, count - 1)
-                self._cells[x][y] = t
-        elif cs == CheckState.flag_or_space:
-            t = self._cells[x][y]
-            if count > 0:
-                self._cells[x][y] = CellStatus.ToFlag
-                self.__run(index + 1, count - 1)
-            self._cells[x][y] = CellStatus.ToSpace
-            self.__run(index + 1, count)
-            self._cells[x][y] = t
-
-    def run(self, debug_print=False):
+        self._runCount += 1
+        for val in [1, 0]:
+            if val and model.mines >= self._remain_mines:
+                continue
+            mark = model.mark()
+            if model.assign(index, val) and model.mines <= self._remain_mines:
+                prefix.append((index, val))
+                self.__split(nextPos, depth - 1, prefix, tasks)
+                prefix.pop()
+            else:
+                self._prunedCount += 1
+            model.undo(mark)
+
+    def _subtree(self, prefix, pos):
+        '''
+        在子进程中穷举一个子树
+
+        返回值:
+            (各雷数的解数, 每个待穷举格子各雷数为雷的解数, 节点数, 剪枝数, 是否在时间内完成)
+        '''
+        size = len(self._counts)
+        self._counts = [0] * size
+        self._cell_counts = [[0] * size for _ in range(self._size)]
+        self._runCount = 0
+        self._prunedCount = 0
+        self._model = ConstraintModel(self._cells, [self._i2xy(i) for i in range(self._size)])
+        self._order.start(self._model)
+        complete = True
+        self._model.propagate_all()
+        for v, val in prefix:
+            self._model.assign(v, val)
+        try:
+            self.__run(pos)
+        except SolverTimeout:
+            complete = False
+        self._model.undo(0)
+        self._model = None
+        return (self._counts, self._cell_counts, self._runCount, self._prunedCount, complete)
+
+    def _parallel_enabled(self, frontier):
+        '待穷举的格子数为 frontier 时是否用进程池'
+        return (self._pool is not None or (self._workers is not None and self._workers > 1)) and frontier >= PARALLEL_MIN_FRONTIER
+
+    def _pool_map(self, name, argsList):
+        '''
+        在进程池中对求解器的拷贝调用 name 方法
+
+        求解器只序列化一次, 每个子进程对同一次调用最多反序列化一次.
+
+        参数:
+            name: 方法名
+            argsList: 每个任务的参数
+
+        返回值:
+            按 argsList 的顺序产生结果的迭代器, 调用方要取完
+        '''
+        pool, self._pool = self._pool, None
+        try:
+            data = pickle.dumps(self)
+        finally:
+            self._pool = pool
+        tasks = [((os.getpid(), next(_solver_keys)), data, name, args) for args in argsList]
+        if pool is not None:
+            yield from pool.imap(_run_worker, tasks)
+        else:
+            from multiprocessing import Pool
+            with Pool(self._workers) as pool:
+                yield from pool.imap(_run_worker, tasks)
+
+    def __parallel(self, tasks):
+        # 子进程得到的是求解器的拷贝, 其中不能有正在穷举的模型
+        model, self._model = self._model, None
+        try:
+            for counts, cell_counts, runCount, prunedCount, complete in self._pool_map('_subtree', tasks):
+                for m, c in enumerate(counts):
+                    self._counts[m] += c
+                for k, cc in enumerate(cell_counts):
+                    row = self._cell_counts[k]
+                    for m, c in enumerate(cc):
+                        if c:
+                            row[m] += c
+                self._runCount += runCount
+                self._prunedCount += prunedCount
+                if not complete:
+                    self._complete = False
+        finally:
+            self._model = model
+
+    def __search(self):
+        self._model = ConstraintModel(self._cells, [self._i2xy(i) for i in range(self._size)])
+        self._order.start(self._model)
+        try:
+            if self._model.propagate_all() and self._model.mines <= self._remain_mines:
+                if self.__counting and self._parallel_enabled(self._size):
+                    tasks = []
+                    self.__split(0, self.__split_depth or ((self._workers or os.cpu_count() or 1) * 8).bit_length(), [], tasks)
+                    self._model.undo(0)
+                    self.__parallel(tasks)
+                else:
+                    self.__run(0)
+        except SolverTimeout:
+            self._complete = False
+        self._model.undo(0)
+
+    def __weights(self):
+        '''
+        各边界雷数下内部格子的方案数
+
+        返回值:
+            (内部格子的方案数, 指定的一个内部格子是雷的方案数), 均按边界雷数排列;
+            log_space 时为同除以最大方案数后的浮点数
+        '''
+        rest = self._remain_mines
+        counts = self._counts
+        if not self.__log_space:
+            weights = [self._in_count(rest - m, False) if c else 0 for m, c in enumerate(counts)]
+            inWeights = [self._in_count(rest - m, True) if c and m < rest else 0 for m, c in enumerate(counts)]
+            return (weights, inWeights)
+        logs = [self._log_in_count(rest - m, False) if c else None for m, c in enumerate(counts)]
+        inLogs = [self._log_in_count(rest - m, True) if c and m < rest else None for m, c in enumerate(counts)]
+        top = max([l for l in logs if l is not None], default=0.0)
+        exp = lambda l: 0.0 if l is None else math.exp(l - top)
+        return ([exp(l) for l in logs], [exp(l) for l in inLogs])
+
+    def __count_aggregate(self, rec):
+        '按雷数加权汇总计数结果, 耗时只与待穷举格子数和雷数种类有关'
         flags = set()
         spaces = set()
-        s = 0
-        if debug_print:
-            s=time.time()
-        self.__run(0, self.__remain_mines)
-        if debug_print:
-            print(f'run count: {self.__runCount}')
-            print(f'self.__run time: {time.time() - s}s')
-            s = time.time()
+        weights, inWeights = self.__weights()
+        allCount = sum([c * w for c, w in zip(self._counts, weights)])
+        if allCount <= 0:
+            return (flags, spaces)
+        self._probability = [[None for _ in range(self._height)] for _ in range(self._width)]
+        # 只有 _accept 的解才会计数, 计数不为0的雷数的权重都大于0,
+        # 所以按整数解数判断是否确定, 与权重是否为浮点数无关
+        mineCounts = [m for m, c in enumerate(self._counts) if c]
+        def put(x, y, val, isSpace, isFlag):
+            # 没穷举完时只是部分解中的频率, 不能据此确定
+            if not self._complete:
+                pass
+            elif isSpace:
+                spaces.add((x, y))
+            elif isFlag:
+                flags.add((x, y))
+            self._probability[x][y] = val / allCount
+        for index in range(self._size):
+            x, y = self._i2xy(index)
+            if self._cells[x][y] == CellStatus.Unknown:
+                cc = self._cell_counts[index]
+                put(x, y, sum([c * w for c, w in zip(cc, weights) if c]), not any(cc), cc == self._counts)
+        interior = self._interior()
+        if len(interior) > 0:
+            val = sum([c * w for c, w in zip(self._counts, inWeights) if c])
+            rests = [self._remain_mines - m for m in mineCounts]
+            for x, y in interior:
+                put(x, y, val, all([r == 0 for r in rests]), all([r == len(interior) for r in rests]))
+        rec.phase('aggregate')
+        return (flags, spaces)
+
+    def run(self, debug_print=False, time_limit=None):
+        self._start_clock(time_limit)
+        rec = begin_call(self, debug_print)
+        flags, spaces = self._enumerate(rec)
+        rec.finish(flags, spaces)
+        return (flags, spaces)
+
+    def _enumerate(self, rec):
+        '穷举并汇总, 截止时间由 _start_clock 设置, 阶段时间和统计记在 rec 中'
+        flags = set()
+        spaces = set()
+        if self.__counting:
+            size = min(self._size, self._remain_mines) + 1
+            self._counts = [0] * size
+            self._cell_counts = [[0] * size for _ in range(self._size)]
+            self.__search()
+            rec.phase('search')
+            rec.set(order=self.order_name, nodes=self._runCount, pruned=self._prunedCount, frontier=self._size, complete=self._complete)
+            return self.__count_aggregate(rec)
+        self.__search()
+        rec.phase('search')
+        rec.set(order=self.order_name, nodes=self._runCount, pruned=self._prunedCount, frontier=self._size, complete=self._complete, solutions=len(self.__results))
         allCount = sum([self._in_count(_count, False) for _, _count in self.__results])
         if allCount < 1:
             return (flags, spaces)
-        if debug_print:
-            print(f'allCount time: {time.time() - s}s')
-            s = time.time()
-        self.__probability = [[None for _ in range(self._height)] for _ in range(self._width)]
+        rec.phase('count')
+        self._probability = [[None for _ in range(self._height)] for _ in range(self._width)]
         def prob_add(x, y, val):
-            if self.__probability[x][y] is None:
-                self.__probability[x][y] = val
+            if self._probability[x][y] is None:
+                self._probability[x][y] = val
             else:
-                self.__probability[x][y] += val
+                self._probability[x][y] += val
+        used = 0
         for __cells, _count in self.__results:
+            # 超时后每个解仍要扫描整个棋盘, 只汇总已经处理了的解
+            if not self._complete and used > 0 and self._expired():
+                break
+            used += 1
             for i in range(self._width):
                 for j in range(self._height):
                     if __cells[i][j] == CellStatus.ToFlagOrSpace:
@@ -126,19 +903,20 @@ class MinesweeperSolverBase(MinesweeperSaverInterface):
                         elif self._cells[i][j] == CellStatus.ToFlag:
                             self._cells[i][j] = CellStatus.ToFlagOrSpace
                         prob_add(i, j, 0)
-        if debug_print:
-            print(f'for for time: {time.time() - s}s')
-            s = time.time()
+        if used < len(self.__results):
+            allCount = sum([self._in_count(_count, False) for _, _count in self.__results[:used]])
+        rec.phase('collect')
         for i in range(self._width):
             for j in range(self._height):
-                if self._cells[i][j] == CellStatus.ToFlag:
+                if not self._complete:
+                    pass
+                elif self._cells[i][j] == CellStatus.ToFlag:
                     flags.add((i, j))
                 elif self._cells[i][j] == CellStatus.ToSpace:
                     spaces.add((i, j))
-                if self.__probability[i][j] is not None:
-                    self.__probability[i][j] /= allCount
-        if debug_print:
-            print(f'for for 2 time: {time.time() - s}s')
+                if self._probability[i][j] is not None:
+                    self._probability[i][j] /= allCount
+        rec.phase('normalize')
         return (flags, spaces)
 
     def __xycheck(self, x, y):
@@ -148,13 +926,9 @@ class MinesweeperSolverBase(MinesweeperSaverInterface):
         assert y < self._height
 
     def _neighbours(self, x, y):
-        '生成邻居列表'
+        '邻居列表(含自身), 取自共用的 BoardGeometry'
         self.__xycheck(x, y)
-        return [ 
-            (i, j)
-            for i in range(max(0, x-1), min(self._width, x+2))
-                for j in range(max(0, y-1), min(self._height, y+2))
-        ]
+        return self._geometry.around[x][y]
 
     def _check(self, x: int, y: int):
         '通过检测周围空白数来判断指定格是否是雷'
@@ -185,8 +959,8 @@ class MinesweeperSolverBase(MinesweeperSaverInterface):
         return state
 
 class MinesweeperSolverByWalkAll(MinesweeperSolverBase):
-    def __init__(self, msOp: MinesweeperOperator):
-        super().__init__(msOp)
+    def __init__(self, msOp: MinesweeperOperator, counting=False, order='raster', workers=None, split_depth=None, log_space=False, pool=None):
+        super().__init__(msOp, counting, order, workers, split_depth, log_space, pool)
 
     def _i2xy(self, index: int):
         return (index // self._height, index % self._height)
@@ -204,13 +978,43 @@ class MinesweeperSolverByWalkAll(MinesweeperSolverBase):
     def _in_count(self, count, other: bool):
         return 1
 
+    def _accept(self, count):
+        return count == 0
+
 class MinesweeperSolverByFloodfill(MinesweeperSolverBase):
-    def __init__(self, msOp: MinesweeperOperator):
-        super().__init__(msOp)
+    '''
+    只穷举边界格子, 内部格子按组合数统计
+
+    max_enumerate 不为None且边界格子数超过它时不再穷举,
+    改用 MonteCarloEstimator 在 samples/time_limit 的限制内估计概率(此时不给出确定的结果).
+    run 有截止时间时, 先用一半的剩余时间穷举, 没穷举完则用另一半做蒙特卡洛估计.
+    '''
+    def __init__(self, msOp: MinesweeperOperator, counting=False, order='raster', max_enumerate=None, samples=200, time_limit=None, seed=None, workers=None, split_depth=None, log_space=False, pool=None):
+        super().__init__(msOp, counting, order, workers, split_depth, log_space, pool)
         self.__edges = []
         self.__ins = []
-        self.__cns = []
-        self.__cn_1s = []
+        self.__max_enumerate = max_enumerate
+        self.__samples = samples
+        self.__time_limit = time_limit
+        self.__seed = seed
+        self.__estimator = None
+
+    @property
+    def probability(self):
+        if self.__estimator is not None:
+            return self.__estimator.probability
+        return super().probability
+
+    @property
+    def interval(self):
+        '蒙特卡洛估计时每格概率的置信区间, 精确穷举时为None'
+        if self.__estimator is not None:
+            return self.__estimator.interval
+        return None
+
+    @property
+    def is_estimate(self):
+        return self.__estimator is not None
 
     def __split_cells(self):
         tempCells = []
@@ -226,10 +1030,17 @@ class MinesweeperSolverByFloodfill(MinesweeperSolverBase):
                 elif any([isSpace(ii, jj) for ii, jj in self._neighbours(i, j)]):
                     if self._cells[i][j] == CellStatus.Unknown:
                         self.__edges.append((i, j))
-                else:
+                elif self._cells[i][j] == CellStatus.Unknown:
                     self.__ins.append((i, j))
 
-    def run(self, debug_print=False):
+    def run(self, debug_print=False, time_limit=None):
+        self._start_clock(time_limit)
+        rec = begin_call(self, debug_print)
+        flags, spaces = self.__solve(rec)
+        rec.finish(flags, spaces)
+        return (flags, spaces)
+
+    def __solve(self, rec):
         self.__split_cells()
         flags = set()
         spaces = set()
@@ -240,16 +1051,31 @@ class MinesweeperSolverByFloodfill(MinesweeperSolverBase):
                 spaces.add((x, y))
             elif cs == CheckState.flag:
                 flags.add((x, y))
+        rec.phase('split')
+        rec.set(frontier=len(self.__edges), interior=len(self.__ins))
         if len(flags) + len(spaces) > 0:
             return (flags, spaces)
-        import math
-        C = lambda n, m: math.factorial(n) // math.factorial(m) // math.factorial(n - m)
-        for i in range(len(self.__ins)):
-            self.__cn_1s.append(C(len(self.__ins) - 1, i))
-        for i in range(len(self.__ins) + 1):
-            self.__cns.append(C(len(self.__ins), i))
+        if self.__max_enumerate is not None and len(self.__edges) > self.__max_enumerate:
+            estimator = MonteCarloEstimator(self._cells, self.__edges, self.__ins, self._remain_mines, self.__samples, self.__time_limit, seed=self.__seed)
+            if estimator.run():
+                self.__estimator = estimator
+            rec.phase('monte_carlo')
+            rec.set(samples=estimator.sample_count, steps=estimator.step_count)
+            return (flags, spaces)
 
-        return MinesweeperSolverBase.run(self, debug_print)
+        if self._deadline is None:
+            return self._enumerate(rec)
+        end = self._deadline
+        self._deadline = time.time() + (end - time.time()) / 2
+        result = self._enumerate(rec)
+        self._deadline = end
+        if not self._complete and end > time.time():
+            estimator = MonteCarloEstimator(self._cells, self.__edges, self.__ins, self._remain_mines, self.__samples, end - time.time(), seed=self.__seed)
+            if estimator.run():
+                self.__estimator = estimator
+            rec.phase('monte_carlo')
+            rec.set(samples=estimator.sample_count, steps=estimator.step_count)
+        return result
 
     def _i2xy(self, index: int):
         assert index >= 0 and index < len(self.__edges)
@@ -280,77 +1106,242 @@ class MinesweeperSolverByFloodfill(MinesweeperSolverBase):
         assert count >= 0
         if other:
             assert count > 0
-            return self.__cn_1s[count - 1]
+            return binomial(len(self.__ins) - 1, count - 1)
         else:
-            return self.__cns[count]
+            return binomial(len(self.__ins), count)
+
+    def _log_in_count(self, count, other: bool):
+        if other:
+            return log_binomial(len(self.__ins) - 1, count - 1)
+        return log_binomial(len(self.__ins), count)
+
+    def _accept(self, count):
+        return count <= len(self.__ins)
+
+    def _interior(self):
+        return self.__ins
+
+# 平移后的8种旋转/翻转
+_SYMMETRIES = (
+    lambda x, y: (x, y),
+    lambda x, y: (-x, y),
+    lambda x, y: (x, -y),
+    lambda x, y: (-x, -y),
+    lambda x, y: (y, x),
+    lambda x, y: (-y, x),
+    lambda x, y: (y, -x),
+    lambda x, y: (-y, -x),
+)
+
+def canonical_component(cells, variables, limit):
+    '''
+    一组边界格子的约束系统的规范编码, 平移、旋转、翻转后相同的组编码相同
+
+    约束系统由待定格子的位置, 以及与它们相邻的数字的位置、还需要的雷数、
+    周围不在待定格子中的未知格子数完全确定, 所以对这些坐标取8种对称中字典序最小的一种.
+
+    参数:
+        cells: 棋盘
+        variables: 组内的格子, list[(x, y)]
+        limit: 穷举时的雷数上限, 不同上限的解数不同, 也作为编码的一部分
+
+    返回值:
+        (编码, 每个格子在规范顺序中的下标)
+    '''
+    around = board_geometry(len(cells), len(cells[0])).around
+    varSet = set(variables)
+    numbers = {}
+    for x, y in variables:
+        for i, j in around[x][y]:
+            if cells[i][j].value < 9 and (i, j) not in numbers:
+                need, free = cells[i][j].value, 0
+                for ii, jj in around[i][j]:
+                    if cells[ii][jj] in [CellStatus.Flagged, CellStatus.ToFlag]:
+                        need -= 1
+                    elif cells[ii][jj] == CellStatus.Unknown and (ii, jj) not in varSet:
+                        free += 1
+                numbers[(i, j)] = (need, free)
+    best = None
+    for f in _SYMMETRIES:
+        moved = [f(x, y) for x, y in variables]
+        movedNumbers = [(f(x, y), info) for (x, y), info in numbers.items()]
+        x0 = min([x for x, _ in moved] + [x for (x, _), _ in movedNumbers])
+        y0 = min([y for _, y in moved] + [y for (_, y), _ in movedNumbers])
+        moved = [(x - x0, y - y0) for x, y in moved]
+        key = (limit, tuple(sorted(moved)), tuple(sorted([((x - x0, y - y0), info) for (x, y), info in movedNumbers])))
+        if best is None or key < best[0]:
+            best = (key, moved)
+    key, moved = best
+    rank = {pos: k for k, pos in enumerate(key[1])}
+    return (key, [rank[pos] for pos in moved])
+
+class ComponentCache:
+    '''
+    边界分组穷举结果的置换表
+
+    键为 canonical_component 的编码, 值为 (各雷数的解数, 按规范顺序排列的组内每格各雷数为雷的解数).
+    超过 maxsize 项时淘汰最久未用的一项. save/load 把表保存到文件, 供多次批量运行之间复用;
+    start_journal 之后新加入的项可以用 new_entries 取出, 用于合并子进程中的表.
+    '''
+    def __init__(self, maxsize=4096):
+        from collections import OrderedDict
+        self.__table = OrderedDict()
+        self.__maxsize = maxsize
+        self.__journal = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__table)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def get(self, key):
+        '返回值: 缓存的值, 没有时为None'
+        value = self.__table.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__table.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.__table[key] = value
+        self.__table.move_to_end(key)
+        while len(self.__table) > self.__maxsize:
+            self.__table.popitem(last=False)
+        if self.__journal is not None:
+            self.__journal.append((key, value))
+
+    def start_journal(self):
+        '开始记录新加入的项'
+        self.__journal = []
+
+    def new_entries(self):
+        '返回并清空 start_journal 或上次调用之后新加入的项'
+        entries = self.__journal or []
+        if self.__journal is not None:
+            self.__journal = []
+        return entries
+
+    def clear(self):
+        self.__table.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path):
+        import pickle
+        with open(path, 'wb') as f:
+            pickle.dump(list(self.__table.items()), f)
+
+    def load(self, path):
+        '读取 save 保存的表并入当前的表, 文件不存在时不做任何事'
+        import os, pickle
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            for key, value in pickle.load(f):
+                self.put(key, value)
+
+# 进程内共用的置换表, 需要缓存时作为 cache 传给 MinesweeperSolverByFloodfillAndGroup
+component_cache = ComponentCache()
 
 class MinesweeperSolverByFloodfillAndGroup(MinesweeperSolverBase):
     '''
     边界分组
+
+    没有共同数字约束的边界格子分在不同的组, 每组只穷举一次,
+    记录该组每种雷数下的解数, 以及组内每格在每种雷数下为雷的解数.
+    各组与内部格子按雷数做多项式卷积, 结合剩余雷数得到精确的全局概率.
+    workers 大于1或给了 pool 时各组在进程池中并行穷举(见 MinesweeperSolverBase), 要穷举的边界格子少于 PARALLEL_MIN_FRONTIER 时串行.
+    log_space 为True时卷积后的内部方案数权重以对数计算并转为浮点数(见 MinesweeperSolverBase).
+    cache 为穷举结果的置换表(ComponentCache, 例如 component_cache), 形状相同的组只穷举一次; None为不使用.
     '''
-    def __init__(self, msOp: MinesweeperOperator):
-        super().__init__(msOp)
+    def __init__(self, msOp: MinesweeperOperator, order='raster', workers=None, log_space=False, cache=None, pool=None):
+        super().__init__(msOp, order=order, workers=workers, pool=pool)
+        self.__log_space = log_space
+        self.__cache = cache
+        self.__keys = []
         self.__edges = []
         self.__ins = []
-        self.__cns = []
-        self.__cn_1s = []
         self.__all_edges = []
-        self.__true_ins = []
 
     def __split_cells(self):
-        tempCells = []
         def isSpace(i, j):
             assert self._cells[i][j] != CellStatus.ToFlagOrSpace
             return self._cells[i][j].value < 9 or self._cells[i][j] == CellStatus.ToSpace
         edges = {}
-        self.__true_ins = []
+        self.__ins = []
         for i in range(self._width):
             for j in range(self._height):
-                if isSpace(i, j):
+                if self._cells[i][j] != CellStatus.Unknown:
                     pass
                 elif any([isSpace(ii, jj) for ii, jj in self._neighbours(i, j)]):
-                    if self._cells[i][j] == CellStatus.Unknown:
-                        edges[(i, j)]=[]
+                    edges[(i, j)] = []
                 else:
-                    self.__true_ins.append((i, j))
-        for i, j in edges:
-            for ii, jj in self._neighbours(i, j):
-                if self._cells[ii][jj].value < 9 or (ii, jj) in edges:
-                    edges[(i, j)].append((ii, jj))
-        group_cells = {}
-        for i, j in edges:
-            for ii, jj in edges[(i, j)]:
-                if (ii, jj) not in group_cells:
-                    group_cells[(ii, jj)] = set()
-                group_cells[(ii, jj)].add((i, j))
-        same_group_cells = {k: set([k]) for k in edges}
-        for k in group_cells:
-            if k in edges:
-                same_group_cells[k] |= group_cells[k]
-            else:
-                for kk in group_cells[k]:
-                    same_group_cells[kk] |= group_cells[k]
-        group_id = [[None for _ in range(self._height)] for _ in range(self._width)]
-        curId = 0
-        def fill_id(k):
-            if group_id[k[0]][k[1]] is not None:
-                return
-            group_id[k[0]][k[1]] = curId
-            for v in same_group_cells[k]:
-                fill_id(v)
-        for i in range(self._width):
-            for j in range(self._height):
-                if (i, j) in same_group_cells and (i, j) not in group_id:
-                    fill_id((i, j))
-                    curId += 1
-        self.__all_edges = [[] for _ in range(curId)]
+                    self.__ins.append((i, j))
+        # 同一个数字周围的边界格子属于同一组
         for i in range(self._width):
             for j in range(self._height):
-                if group_id[i][j] is not None:
-                    self.__all_edges[group_id[i][j]].append((i, j))
-        # TODO: edge生成完成， 下一步改run
+                if self._cells[i][j].value > 8:
+                    continue
+                same = [k for k in self._neighbours(i, j) if k in edges]
+                for k in same:
+                    edges[k] += same
+        group_id = {}
+        self.__all_edges = []
+        for k in edges:
+            if k in group_id:
+                continue
+            group_id[k] = len(self.__all_edges)
+            group = [k]
+            for cur in group:
+                for v in edges[cur]:
+                    if v not in group_id:
+                        group_id[v] = group_id[k]
+                        group.append(v)
+            self.__all_edges.append(sorted(group))
+
+    def __run(self, pos: int, limit: int):
+        self._runCount += 1
+        if self._runCount & 0xff == 0 and self._expired():
+            raise SolverTimeout()
+        model = self._model
+        index, pos = self._order.next(model, pos)
+        if index is None:
+            self._append_convert(self._cells, model.mines)
+            return
+        for val in [1, 0]:
+            if val and model.mines >= limit:
+                continue
+            mark = model.mark()
+            if model.assign(index, val) and model.mines <= limit:
+                self.__run(pos, limit)
+            else:
+                self._prunedCount += 1
+            model.undo(mark)
+
+    @staticmethod
+    def __convolve(a, b):
+        r = [0] * (len(a) + len(b) - 1)
+        for i, va in enumerate(a):
+            if va:
+                for j, vb in enumerate(b):
+                    r[i + j] += va * vb
+        return r
 
-    def run(self, debug_print=False):
+    def run(self, debug_print=False, time_limit=None):
+        self._start_clock(time_limit)
+        rec = begin_call(self, debug_print)
+        flags, spaces = self.__solve(rec)
+        rec.finish(flags, spaces)
+        return (flags, spaces)
+
+    def __solve(self, rec):
         self.__split_cells()
         flags = set()
         spaces = set()
@@ -362,24 +1353,167 @@ class MinesweeperSolverByFloodfillAndGroup(MinesweeperSolverBase):
                     spaces.add((x, y))
                 elif cs == CheckState.flag:
                     flags.add((x, y))
+        rec.phase('split')
+        rec.set(frontier=sum([len(edges) for edges in self.__all_edges]), interior=len(self.__ins), components=[len(edges) for edges in self.__all_edges])
         if len(flags) + len(spaces) > 0:
             return (flags, spaces)
-        import math
-        C = lambda n, m: math.factorial(n) // math.factorial(m) // math.factorial(n - m)
+        # results[k]: 第k组的 (各雷数的解数, 组内每格各雷数为雷的解数)
+        results = {}
+        self.__keys = [None] * len(self.__all_edges)
+        if self.__cache is not None:
+            for k in range(len(self.__all_edges)):
+                hit = self.__lookup(k)
+                if hit is not None:
+                    results[k] = hit
+        todo = [k for k in range(len(self.__all_edges)) if k not in results]
+        if len(todo) > 1 and self._parallel_enabled(sum([len(self.__all_edges[k]) for k in todo])):
+            # 置换表不传给子进程, 结果在本进程中存入
+            cache, self.__cache = self.__cache, None
+            try:
+                # 按组的顺序取结果, 超时的组及之后的组都不用
+                for k, (counts, cell_counts, runCount, prunedCount, complete) in zip(todo, self._pool_map('_component', [(k,) for k in todo])):
+                    self._runCount += runCount
+                    self._prunedCount += prunedCount
+                    if not complete:
+                        self._complete = False
+                    if self._complete:
+                        results[k] = (counts, cell_counts)
+            finally:
+                self.__cache = cache
+        else:
+            for k in todo:
+                counts, cell_counts, _, _, complete = self._component(k)
+                if not complete:
+                    self._complete = False
+                    break
+                results[k] = (counts, cell_counts)
+        if self.__cache is not None and self._complete:
+            for k in todo:
+                self.__store(k, *results[k])
+        rec.phase('enumerate')
+        rec.set(order=self.order_name, nodes=self._runCount, pruned=self._prunedCount, complete=self._complete)
+        if self.__cache is not None:
+            rec.set(cache_hits=len(self.__all_edges) - len(todo), cache_misses=len(todo))
+        if not self._complete:
+            return self.__partial(results)
+        groups = [results[k] for k in range(len(self.__all_edges))]
 
-        for k in range(len(self.__all_edges)):
-            self.__ins = self.__true_ins + [v for kk in range(len(self.__all_edges)) if kk != k for v in self.__all_edges[kk]]
-            for i in range(len(self.__ins)):
-                self.__cn_1s.append(C(len(self.__ins) - 1, i))
-            for i in range(len(self.__ins) + 1):
-                self.__cns.append(C(len(self.__ins), i))
+        # prefix[k]: 前k组的卷积, suffix[k]: 第k组及之后的卷积
+        prefix = [[1]]
+        for counts, _ in groups:
+            prefix.append(self.__convolve(prefix[-1], counts))
+        suffix = [[1]]
+        for counts, _ in reversed(groups):
+            suffix.append(self.__convolve(counts, suffix[-1]))
+        suffix.reverse()
 
-            self.__edges = self.__all_edges[k]
-            flags, spaces = MinesweeperSolverBase.run(self, debug_print)
-            if len(flags) + len(spaces) > 0:
-                return (flags, spaces)
+        inCount = len(self.__ins)
+        rest = self._remain_mines
+        if self.__log_space:
+            top = max([self._log_in_count(rest - m, False) for m, c in enumerate(prefix[-1]) if c and 0 <= rest - m <= inCount], default=0.0)
+            def weight(m, other=False):
+                l = self._log_in_count(rest - m, other)
+                return 0.0 if l is None else math.exp(l - top)
+        else:
+            weight = lambda m, other=False: self._in_count(rest - m, other)
+        # 边界共有m个雷时是否有解: 用于按整数判断确定的格子, 与权重是否为浮点数无关
+        feasible = lambda m: 0 <= rest - m <= inCount
+        allCount = sum([c * weight(m) for m, c in enumerate(prefix[-1]) if c])
+        if allCount <= 0:
+            return (flags, spaces)
 
-        return (set(), set())
+        self._probability = [[None for _ in range(self._height)] for _ in range(self._width)]
+        def put(x, y, val, isSpace, isFlag):
+            if isSpace:
+                spaces.add((x, y))
+            elif isFlag:
+                flags.add((x, y))
+            self._probability[x][y] = val / allCount
+        for k, (counts, cell_counts) in enumerate(groups):
+            others = self.__convolve(prefix[k], suffix[k + 1])
+            g = [sum([c * weight(t + m) for m, c in enumerate(others) if c]) for t in range(len(counts))]
+            # 本组有t个雷时其余部分是否有解
+            valid = [c > 0 and any([o and feasible(t + m) for m, o in enumerate(others)]) for t, c in enumerate(counts)]
+            for (x, y), cc in zip(self.__all_edges[k], cell_counts):
+                used = [(c, counts[t]) for t, c in enumerate(cc) if valid[t]]
+                put(x, y, sum([c * g[t] for t, c in enumerate(cc) if c]), all([c == 0 for c, _ in used]), all([c == n for c, n in used]))
+        if inCount > 0:
+            val = sum([c * weight(m, True) for m, c in enumerate(prefix[-1]) if c])
+            rests = [rest - m for m, c in enumerate(prefix[-1]) if c and feasible(m)]
+            for x, y in self.__ins:
+                put(x, y, val, all([r == 0 for r in rests]), all([r == inCount for r in rests]))
+        rec.phase('convolve')
+        return (flags, spaces)
+
+    def _component(self, k):
+        '''
+        穷举第k组
+
+        返回值:
+            (各雷数的解数, 组内每格各雷数为雷的解数, 节点数, 剪枝数, 是否在时间内完成)
+        '''
+        edges = self.__all_edges[k]
+        runCount, prunedCount = self._runCount, self._prunedCount
+        self.__edges = edges
+        self._counts = [0] * (len(edges) + 1)
+        self._cell_counts = [[0] * (len(edges) + 1) for _ in edges]
+        limit = min(self._remain_mines, len(edges))
+        self._model = ConstraintModel(self._cells, edges)
+        self._order.start(self._model)
+        complete = True
+        try:
+            if self._model.propagate_all() and self._model.mines <= limit:
+                self.__run(0, limit)
+        except SolverTimeout:
+            complete = False
+        self._model.undo(0)
+        self._model = None
+        return (self._counts, self._cell_counts, self._runCount - runCount, self._prunedCount - prunedCount, complete)
+
+    def __lookup(self, k):
+        '''
+        在置换表中查第k组, 编码保存在 self.__keys[k] 中
+
+        返回值:
+            (各雷数的解数, 组内每格各雷数为雷的解数), 没有时为None
+        '''
+        edges = self.__all_edges[k]
+        key, order = canonical_component(self._cells, edges, min(self._remain_mines, len(edges)))
+        self.__keys[k] = (key, order)
+        hit = self.__cache.get(key)
+        if hit is None:
+            return None
+        counts, cell_counts = hit
+        return (counts, [cell_counts[i] for i in order])
+
+    def __store(self, k, counts, cell_counts):
+        key, order = self.__keys[k]
+        canonical = [None] * len(order)
+        for cc, i in zip(cell_counts, order):
+            canonical[i] = cc
+        self.__cache.put(key, (counts, canonical))
+
+    def __partial(self, results):
+        '''
+        超时时只用已经穷举完的组: 组内所有解中都是雷(或都不是雷)的格子是确定的,
+        概率只按组内的解数估计, 没有考虑剩余雷数
+        '''
+        flags = set()
+        spaces = set()
+        self._probability = [[None for _ in range(self._height)] for _ in range(self._width)]
+        for k, (counts, cell_counts) in results.items():
+            edges = self.__all_edges[k]
+            total = sum(counts)
+            if total < 1:
+                continue
+            for (x, y), cc in zip(edges, cell_counts):
+                mines = sum(cc)
+                if mines == 0:
+                    spaces.add((x, y))
+                elif mines == total:
+                    flags.add((x, y))
+                self._probability[x][y] = mines / total
+        return (flags, spaces)
 
     def _i2xy(self, index: int):
         assert index >= 0 and index < len(self.__edges)
@@ -390,29 +1524,21 @@ class MinesweeperSolverByFloodfillAndGroup(MinesweeperSolverBase):
         return len(self.__edges)
 
     def _append_convert(self, cells, count):
-        import copy
-        if count > len(self.__ins):
-            return None
-        tc = copy.deepcopy(cells)
-        if count == 0:
-            for i, j in self.__ins:
-                tc[i][j] = CellStatus.ToSpace
-        elif count == len(self.__ins):
-            for i, j in self.__ins:
-                tc[i][j] = CellStatus.ToFlag
-        else:
-            for i, j in self.__ins:
-                tc[i][j] = CellStatus.ToFlagOrSpace
-        return (copy.deepcopy(tc), count)
+        self._counts[count] += 1
+        for k in self._model.mine_stack:
+            self._cell_counts[k][count] += 1
+        return None
 
     def _in_count(self, count, other: bool):
-        assert count <= len(self.__ins)
-        assert count >= 0
+        '内部格子放count个雷的方案数, other为True时为指定的一个内部格子是雷的方案数'
         if other:
-            assert count > 0
-            return self.__cn_1s[count - 1]
-        else:
-            return self.__cns[count]
+            return binomial(len(self.__ins) - 1, count - 1) if count > 0 else 0
+        return binomial(len(self.__ins), count)
+
+    def _log_in_count(self, count, other: bool):
+        if other:
+            return log_binomial(len(self.__ins) - 1, count - 1) if count > 0 else None
+        return log_binomial(len(self.__ins), count)
 
 class CellInfo:
     def __init__(self, i, j, width, height, cells):
@@ -421,19 +1547,17 @@ class CellInfo:
         self.__y = j
         self.__info = cells[i][j]
         self.__neighbours = {CellStatus(i): set() for i in range(11)}
-        for ii in range(max(0, i-1), min(width, i+2)):
-            for jj in range(max(0, j-1), min(height, j+2)):
-                if ii != i or jj != j:
-                    self.__neighbours[cells[ii][jj]].add((ii, jj))
+        geometry = board_geometry(width, height)
+        for ii, jj in geometry.neighbours[i][j]:
+            self.__neighbours[cells[ii][jj]].add((ii, jj))
         self.__advance_num_neighbours = {
             (ii, jj) : {
                 'common': set(),
                 'only' : set(),
                 'other' : set()
             }
-            for ii in range(max(0, i-2), min(width, i+3))
-                for jj in range(max(0, j-2), min(height, j+3))
-                    if (ii != i or jj != j) and cells[ii][jj].value > 0 and cells[ii][jj].value < 9
+            for ii, jj in geometry.neighbours5[i][j]
+                if cells[ii][jj].value > 0 and cells[ii][jj].value < 9
         }
 
     @property
@@ -460,20 +1584,106 @@ class CellInfo:
     def advance_num_neighbours(self):
         return self.__advance_num_neighbours
 
+    def update_neighbour(self, pos, old, new):
+        '邻居pos的状态由old变为new'
+        self.__neighbours[old].discard(pos)
+        self.__neighbours[new].add(pos)
+
+    def add_advance_num_neighbour(self, pos):
+        '5×5范围内的pos变成了数字'
+        self.__advance_num_neighbours.setdefault(pos, {
+            'common': set(),
+            'only' : set(),
+            'other' : set()
+        })
+
     def init_advance_num_neighbours(self, cellInfos):
         for pos in self.__advance_num_neighbours:
             self.__advance_num_neighbours[pos]['common'] = self.__neighbours[CellStatus.Unknown] & cellInfos[pos].neighbours[CellStatus.Unknown]
             self.__advance_num_neighbours[pos]['only'] = self.__neighbours[CellStatus.Unknown] - cellInfos[pos].neighbours[CellStatus.Unknown]
             self.__advance_num_neighbours[pos]['other'] = cellInfos[pos].neighbours[CellStatus.Unknown] - self.__neighbours[CellStatus.Unknown]
 
+def linear_deduce(rows, deadline=None):
+    '''
+    对0/1变量的线性方程组做整数高斯消元(无分数, 每行按最大公约数约简),
+    再对消元后的每一行用0/1取值范围推出必然取值的变量
+
+    参数:
+        rows: list[(dict{变量: 系数}, 右端值)]
+        deadline: 截止时间(time.time()), 到时间后不再加入新的行, 只用已消元的行推导(仍然正确)
+
+    返回值:
+        (必为1的变量集合, 必为0的变量集合)
+    '''
+    reduced = []
+    for coeffs, rhs in rows:
+        if deadline is not None and time.time() > deadline:
+            break
+        row = dict(coeffs)
+        for pivot, prow, prhs in reduced:
+            a = row.get(pivot, 0)
+            if a == 0:
+                continue
+            p = prow[pivot]
+            row = {k: v * p for k, v in row.items()}
+            for k, v in prow.items():
+                row[k] = row.get(k, 0) - a * v
+            rhs = rhs * p - a * prhs
+            row = {k: v for k, v in row.items() if v != 0}
+        if len(row) == 0:
+            continue
+        pivot = min(row)
+        g = math.gcd(rhs, *row.values())
+        if row[pivot] < 0:
+            g = -g
+        row = {k: v // g for k, v in row.items()}
+        rhs //= g
+        # 把新主元从已有的行中消去, 保持简化阶梯形
+        for k, (opivot, orow, orhs) in enumerate(reduced):
+            a = orow.get(pivot, 0)
+            if a == 0:
+                continue
+            p = row[pivot]
+            orow = {kk: v * p for kk, v in orow.items()}
+            for kk, v in row.items():
+                orow[kk] = orow.get(kk, 0) - a * v
+            orhs = orhs * p - a * rhs
+            orow = {kk: v for kk, v in orow.items() if v != 0}
+            og = math.gcd(orhs, *orow.values())
+            if orow[opivot] < 0:
+                og = -og
+            reduced[k] = (opivot, {kk: v // og for kk, v in orow.items()}, orhs // og)
+        reduced.append((pivot, row, rhs))
+
+    ones, zeros = set(), set()
+    for _, row, rhs in reduced:
+        lo = sum([v for v in row.values() if v < 0])
+        hi = sum([v for v in row.values() if v > 0])
+        for k, v in row.items():
+            # 取0或取1时该行能达到的范围不包含rhs, 则只能取另一个值
+            if v > 0:
+                if lo + v > rhs:
+                    zeros.add(k)
+                elif hi - v < rhs:
+                    ones.add(k)
+            else:
+                if lo - v > rhs:
+                    ones.add(k)
+                elif hi + v < rhs:
+                    zeros.add(k)
+    return (ones, zeros)
+
 class MinesweeperSolverByNumber(MinesweeperSaverInterface):
     def __init__(self, msOp: MinesweeperOperator):
-        self._cells = msOp.all_cells
+        self._cells = msOp.cells_view
         assert all([len(self._cells[0]) == len(self._cells[i]) for i in range(1, len(self._cells))])
         self._width = len(self._cells)
         self._height = len(self._cells[0])
+        self._geometry = board_geometry(self._width, self._height)
+        self._remain_mines = msOp.remain_mines
         self.__is_guess = False
         self.is_advance = False
+        self.is_linear = False
         self._cellInfos = {
             (i, j) :
                 CellInfo(i, j, self._width, self._height, self._cells)
@@ -484,44 +1694,154 @@ class MinesweeperSolverByNumber(MinesweeperSaverInterface):
             self._cellInfos[pos].init_advance_num_neighbours(self._cellInfos)
         self._numsWithUnknown = dict(filter(lambda item: item[1].info.value > 0 and item[1].info.value < 9 and len(item[1].neighbours[CellStatus.Unknown]) > 0, self._cellInfos.items()))
 
-    def run(self):
+    def _basic_candidates(self):
+        '需要做单个数字检测的数字'
+        return self._numsWithUnknown.items()
+
+    def _advance_candidates(self):
+        '需要做两个数字组合检测的数字'
+        return self._numsWithUnknown.items()
+
+    def run(self, debug_print=False, time_limit=None):
+        self._start_clock(time_limit)
+        rec = begin_call(self, debug_print)
+        flags, spaces = self.__solve(rec)
+        rec.set(numbers=len(self._numsWithUnknown), advance=self.is_advance, linear=self.is_linear, guess=self.__is_guess, complete=self._complete)
+        rec.finish(flags, spaces)
+        return (flags, spaces)
+
+    def __solve(self, rec):
         self.__to_flags = set()
         self.__to_spaces = set()
+        self.__is_guess = False
+        self.is_advance = False
+        self.is_linear = False
 
         self.__basic_solver()
+        rec.phase('basic')
         if len(self.__to_flags) + len(self.__to_spaces) > 0:
             return (self.__to_flags, self.__to_spaces)
         self.__advance_solver()
+        rec.phase('advance')
+        if len(self.__to_flags) + len(self.__to_spaces) > 0:
+            self.is_advance = True
+            return (self.__to_flags, self.__to_spaces)
+        if self._expired():
+            self._complete = False
+        else:
+            self.__linear_solver()
+            rec.phase('linear')
         if len(self.__to_flags) + len(self.__to_spaces) > 0:
             self.is_advance = True
+            self.is_linear = True
             return (self.__to_flags, self.__to_spaces)
         self.__guess_solver()
+        rec.phase('guess')
         assert len(self.__to_spaces) > 0
         return (self.__to_flags, self.__to_spaces)
 
+    def stream(self, time_limit=None):
+        '''
+        逐个给出推出的格子, 每项为 (x, y, CellStatus.ToFlag 或 CellStatus.ToSpace)
+
+        每检测完一个数字就给出它推出的新格子, 调用方可以在两次取值之间操作棋盘.
+        某一阶段有新结果后重新从单个数字的检测开始, 直到单个数字、两个数字、线性推导都没有新结果.
+        整个过程都没有结果时给出一个猜测的空白格子, 此时 is_guess 为True.
+        全部取完时生成一条记录, 其中的时间包含调用方在两次取值之间所用的时间.
+        '''
+        self._start_clock(time_limit)
+        rec = begin_call(self)
+        self.__to_flags = set()
+        self.__to_spaces = set()
+        self.__is_guess = False
+        self.is_advance = False
+        self.is_linear = False
+        given = set()
+        givenFlags = set()
+        def fresh(flags, spaces):
+            result = [(x, y, CellStatus.ToFlag) for x, y in flags if (x, y) not in given]
+            givenFlags.update([(x, y) for x, y, _ in result])
+            result += [(x, y, CellStatus.ToSpace) for x, y in spaces if (x, y) not in given]
+            given.update([(x, y) for x, y, _ in result])
+            return result
+        while True:
+            found = False
+            for pos, cellInfo in list(self._basic_candidates()):
+                items = fresh(*self.__basic_check(cellInfo))
+                # 在给出结果之前记下, 调用方操作后这个数字若有变化会重新进入待检测的集合
+                self._basic_checked(pos)
+                for item in items:
+                    found = True
+                    yield item
+            if found:
+                continue
+            for pos, cellInfo in list(self._advance_candidates()):
+                for item in fresh(*self.__advance_check(pos, cellInfo)):
+                    found = True
+                    self.is_advance = True
+                    yield item
+            if found:
+                continue
+            if self._expired():
+                self._complete = False
+                break
+            ones, zeros = self.__linear_deduce()
+            for item in fresh(ones, zeros):
+                found = True
+                self.is_advance = True
+                self.is_linear = True
+                yield item
+            if not found:
+                break
+        if len(given) < 1:
+            self.__guess_solver()
+            for x, y in self.__to_spaces:
+                yield (x, y, CellStatus.ToSpace)
+        rec.set(stream=True, numbers=len(self._numsWithUnknown), advance=self.is_advance, linear=self.is_linear, guess=self.__is_guess, complete=self._complete)
+        rec.finish(givenFlags, self.__to_spaces if self.__is_guess else given - givenFlags)
+
+    def _basic_checked(self, pos):
+        'stream 中这个数字做完了单个数字的检测'
+        pass
+
+    def __basic_check(self, cellInfo):
+        '单个数字, 返回 (必为雷的格子, 必为空白的格子)'
+        if cellInfo.info.value == len(cellInfo.neighbours[CellStatus.Flagged]):
+            return (set(), set(cellInfo.neighbours[CellStatus.Unknown]))
+        elif cellInfo.info.value == len(cellInfo.neighbours[CellStatus.Flagged]) + len(cellInfo.neighbours[CellStatus.Unknown]):
+            return (set(cellInfo.neighbours[CellStatus.Unknown]), set())
+        assert cellInfo.info.value > len(cellInfo.neighbours[CellStatus.Flagged])
+        assert cellInfo.info.value < len(cellInfo.neighbours[CellStatus.Flagged]) + len(cellInfo.neighbours[CellStatus.Unknown])
+        return (set(), set())
+
+    def __advance_check(self, pos, cellInfo):
+        '这个数字与附近每个数字的组合, 返回 (必为雷的格子, 必为空白的格子)'
+        flags = set()
+        spaces = set()
+        for opos, neighbourInfo in self._cellInfos[pos].advance_num_neighbours.items():
+            selfVal = cellInfo.info.value - len(cellInfo.neighbours[CellStatus.Flagged])
+            otherVal = self._cellInfos[opos].info.value - len(self._cellInfos[opos].neighbours[CellStatus.Flagged])
+            if selfVal == otherVal:
+                if len(neighbourInfo['only']) < 1:
+                    spaces |= neighbourInfo['other']
+            elif selfVal > otherVal:
+                assert len(neighbourInfo['only']) >= selfVal - otherVal
+                if len(neighbourInfo['only']) == selfVal - otherVal:
+                    flags |= neighbourInfo['only']
+                    spaces |= neighbourInfo['other']
+        return (flags, spaces)
+
     def __basic_solver(self):
-        for k, cellInfo in self._numsWithUnknown.items():
-            if cellInfo.info.value == len(cellInfo.neighbours[CellStatus.Flagged]):
-                self.__to_spaces |= cellInfo.neighbours[CellStatus.Unknown]
-            elif cellInfo.info.value == len(cellInfo.neighbours[CellStatus.Flagged]) + len(cellInfo.neighbours[CellStatus.Unknown]):
-                self.__to_flags |= cellInfo.neighbours[CellStatus.Unknown]
-            else:
-                assert cellInfo.info.value > len(cellInfo.neighbours[CellStatus.Flagged])
-                assert cellInfo.info.value < len(cellInfo.neighbours[CellStatus.Flagged]) + len(cellInfo.neighbours[CellStatus.Unknown])
+        for k, cellInfo in self._basic_candidates():
+            flags, spaces = self.__basic_check(cellInfo)
+            self.__to_flags |= flags
+            self.__to_spaces |= spaces
 
     def __advance_solver(self):
-        for pos, cellInfo in self._numsWithUnknown.items():
-            for opos, neighbourInfo in self._cellInfos[pos].advance_num_neighbours.items():
-                selfVal = cellInfo.info.value - len(cellInfo.neighbours[CellStatus.Flagged])
-                otherVal = self._cellInfos[opos].info.value - len(self._cellInfos[opos].neighbours[CellStatus.Flagged])
-                if selfVal == otherVal:
-                    if len(neighbourInfo['only']) < 1:
-                        self.__to_spaces |= neighbourInfo['other']
-                elif selfVal > otherVal:
-                    assert len(neighbourInfo['only']) >= selfVal - otherVal
-                    if len(neighbourInfo['only']) == selfVal - otherVal:
-                        self.__to_flags |= neighbourInfo['only']
-                        self.__to_spaces |= neighbourInfo['other']
+        for pos, cellInfo in self._advance_candidates():
+            flags, spaces = self.__advance_check(pos, cellInfo)
+            self.__to_flags |= flags
+            self.__to_spaces |= spaces
         # TODO:
         '''
         @1
@@ -534,8 +1854,33 @@ class MinesweeperSolverByNumber(MinesweeperSaverInterface):
         '''
         assert len(self.__to_flags & self.__to_spaces) < 1
 
+    def __linear_solver(self):
+        ones, zeros = self.__linear_deduce()
+        self.__to_flags |= ones
+        self.__to_spaces |= zeros
+        assert len(self.__to_flags & self.__to_spaces) < 1
+
+    def __linear_deduce(self):
+        '''
+        所有数字(以及剩余雷数)组成的线性方程组, 消元后推出整条边界上必然的雷和空白
+        '''
+        rows = []
+        for pos, cellInfo in self._numsWithUnknown.items():
+            rows.append((
+                {cell: 1 for cell in cellInfo.neighbours[CellStatus.Unknown]},
+                cellInfo.info.value - len(cellInfo.neighbours[CellStatus.Flagged])
+            ))
+        unknowns = [(i, j) for i in range(self._width) for j in range(self._height) if self._cells[i][j] == CellStatus.Unknown]
+        rows.append(({cell: 1 for cell in unknowns}, self._remain_mines))
+        ones, zeros = linear_deduce(rows, self._deadline)
+        if self._expired():
+            self._complete = False
+        return (ones, zeros)
+
     def __guess_solver(self):
         unknowns = list(set([cell for pos, cellInfo in self._numsWithUnknown.items() for cell in cellInfo.neighbours[CellStatus.Unknown]]))
+        if len(unknowns) < 1:
+            unknowns = [(i, j) for i in range(self._width) for j in range(self._height) if self._cells[i][j] == CellStatus.Unknown]
         from random import choice
         self.__to_spaces.add(choice(unknowns))
         self.__is_guess = True
@@ -543,3 +1888,98 @@ class MinesweeperSolverByNumber(MinesweeperSaverInterface):
     @property
     def is_guess(self):
         return self.__is_guess
+
+class MinesweeperSolverSession(MinesweeperSolverByNumber):
+    '''
+    跨步骤复用的求解器
+
+    只在创建时复制一次棋盘, 之后订阅棋盘的变化, 只更新变化格子附近的 CellInfo.
+    单个数字和两个数字的检测只针对上次检测之后周围有变化的数字,
+    每步的开销与变化的格子数有关, 与棋盘大小无关.
+    '''
+    def __init__(self, msOp: MinesweeperOperator):
+        super().__init__(msOp)
+        # 之后会随棋盘变化而修改
+        self._cells = self._cells.copy()
+        self._dirty = set(self._numsWithUnknown)
+        # stream 中已经做过单个数字检测, 还没做两个数字检测的数字
+        self._checked = set()
+        msOp.subscribe(self.update)
+
+    def __around(self, cells, r):
+        window = self._geometry.window(r)
+        return set([pos for x, y in cells for pos in window[x][y]])
+
+    def update(self, changed):
+        '''
+        棋盘变化时调用
+
+        参数:
+            changed: 状态改变了的格子, list[(x, y, CellStatus)]
+        '''
+        for x, y, status in changed:
+            old = self._cells[x][y]
+            if old == CellStatus.Flagged:
+                self._remain_mines += 1
+            if status == CellStatus.Flagged:
+                self._remain_mines -= 1
+            self._cells[x][y] = status
+            for pos in self.__around([(x, y)], 1):
+                if pos != (x, y):
+                    self._cellInfos[pos].update_neighbour((x, y), old, status)
+            self._cellInfos[(x, y)] = CellInfo(x, y, self._width, self._height, self._cells)
+            if status.value in range(1, 9):
+                for pos in self.__around([(x, y)], 2):
+                    if pos != (x, y):
+                        self._cellInfos[pos].add_advance_num_neighbour((x, y))
+        cells = [(x, y) for x, y, _ in changed]
+        # 周围格子集合变化的是3×3范围内的格子, 和它们组成数字组合的是7×7范围内的数字
+        for pos in self.__around(cells, 3):
+            if self._cells[pos[0]][pos[1]].value in range(1, 9):
+                self._cellInfos[pos].init_advance_num_neighbours(self._cellInfos)
+        for pos in self.__around(cells, 1):
+            cellInfo = self._cellInfos[pos]
+            if cellInfo.info.value > 0 and cellInfo.info.value < 9 and len(cellInfo.neighbours[CellStatus.Unknown]) > 0:
+                self._numsWithUnknown[pos] = cellInfo
+                self._dirty.add(pos)
+            else:
+                self._numsWithUnknown.pop(pos, None)
+                self._dirty.discard(pos)
+                self._checked.discard(pos)
+
+    def _basic_candidates(self):
+        return [(pos, self._numsWithUnknown[pos]) for pos in self._dirty]
+
+    def _advance_candidates(self):
+        around = self._dirty | self._checked
+        for pos in self._dirty | self._checked:
+            around |= set(self._cellInfos[pos].advance_num_neighbours)
+        return [(pos, self._numsWithUnknown[pos]) for pos in around if pos in self._numsWithUnknown]
+
+    def _basic_checked(self, pos):
+        if pos in self._dirty:
+            self._dirty.discard(pos)
+            self._checked.add(pos)
+
+    def stream(self, time_limit=None):
+        '''
+        与 MinesweeperSolverByNumber.stream 相同, 但调用方在两次取值之间点开的格子会通过 update 反馈回来,
+        新出现的数字在同一次 stream 中继续检测
+        '''
+        try:
+            yield from super().stream(time_limit)
+            # 所有变化过的数字都做过检测了
+            self._dirty.clear()
+            self._checked.clear()
+        finally:
+            # 提前结束时, 只做过单个数字检测的数字下次仍要检测
+            self._dirty |= self._checked
+            self._checked.clear()
+
+    def run(self, debug_print=False, time_limit=None):
+        result = super().run(debug_print, time_limit)
+        toFlags, toSpaces = result
+        if self.is_advance or self.is_guess or len(toFlags) + len(toSpaces) < 1:
+            # 所有变化过的数字都做过单个数字和两个数字的检测了
+            self._dirty.clear()
+        return result
@@ -0,0 +1,160 @@
+import os, sys, json
+from time import perf_counter
+from MinesweeperSolver import MinesweeperSolverByWalkAll, MinesweeperSolverByFloodfill, MinesweeperSolverByFloodfillAndGroup, MinesweeperSolverByNumber
+from MinesweeperGenerate import CellStatus
+from MinesweeperPosition import load_positions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SOLVERS = {
+    'walkall': lambda pos: MinesweeperSolverByWalkAll(pos, counting=True),
+    'floodfill': lambda pos: MinesweeperSolverByFloodfill(pos, counting=True),
+    # 不用置换表, 重复运行时测的仍是穷举
+    'group': lambda pos: MinesweeperSolverByFloodfillAndGroup(pos, cache=None),
+    'number': MinesweeperSolverByNumber,
+}
+# 穷举求解器: 都做了完整穷举时确定的格子和概率应该相同
+EXACT = ['walkall', 'floodfill', 'group']
+
+def run_solver(name, pos, repeat):
+    '''
+    在局面上运行求解器 repeat 次
+
+    返回值:
+        (写入结果文件的统计 dict, 确定的雷, 确定的空白, 概率或None)
+    '''
+    times = []
+    for _ in range(repeat):
+        solver = SOLVERS[name](pos)
+        start = perf_counter()
+        flags, spaces = solver.run()
+        times.append(perf_counter() - start)
+    guess = solver.is_guess
+    if guess:
+        flags, spaces = set(), set()
+    stats = {
+        'time': min(times),
+        'nodes': getattr(solver, 'node_count', None),
+        'flags': len(flags),
+        'spaces': len(spaces),
+        'guess': guess,
+    }
+    return (stats, flags, spaces, getattr(solver, 'probability', None))
+
+def check_agreement(results):
+    '''
+    检查同一局面上各求解器的结果是否一致
+
+    参数:
+        results: {求解器: (确定的雷, 确定的空白, 概率或None)}
+
+    返回值:
+        不一致之处的说明, list[str]
+    '''
+    problems = []
+    names = list(results)
+    for a in names:
+        for b in names:
+            conflict = results[a][0] & results[b][1]
+            if conflict:
+                problems.append(f'{a} flags and {b} opens {sorted(conflict)}')
+    # 有概率的穷举求解器做了完整穷举, 结果应完全相同; 其他求解器确定的格子应包含在其中
+    full = [name for name in EXACT if name in results and results[name][2] is not None]
+    if len(full) < 1:
+        return problems
+    ref = full[0]
+    flags, spaces, probability = results[ref]
+    for name in full[1:]:
+        if results[name][0] != flags or results[name][1] != spaces:
+            problems.append(f'{name} certain cells differ from {ref}')
+        other = results[name][2]
+        diff = max([abs(p - q) for col, ocol in zip(probability, other) for p, q in zip(col, ocol) if p is not None and q is not None], default=0.0)
+        if diff > 1e-9 or any([(p is None) != (q is None) for col, ocol in zip(probability, other) for p, q in zip(col, ocol)]):
+            problems.append(f'{name} probability differs from {ref} by {diff}')
+    for name in names:
+        if not results[name][0] <= flags or not results[name][1] <= spaces:
+            problems.append(f'{name} claims cells that {ref} does not prove')
+    return problems
+
+def compare(report, baseline, threshold, min_time, time_gate = False):
+    '''
+    与基线比较, 打印每项的时间比和节点数的变化
+
+    时间是在写基线的机器上测的, 默认只作参考: 基线时间不少于 min_time 且变慢超过 threshold 倍时标出 slower,
+    time_gate 为True时这也算失败. 节点数和结果与机器无关, 有变化就算失败.
+
+    返回值:
+        节点数和结果是否都没有变化(time_gate 时还要求没有 slower)
+    '''
+    ok = True
+    print()
+    print('{:<20}{:<12}{:>12}{:>12}{:>9}  {}'.format('position', 'solver', 'base', 'now', 'ratio', 'note'))
+    for pos, solvers in report['results'].items():
+        for name, now in solvers.items():
+            base = baseline['results'].get(pos, {}).get(name)
+            if base is None:
+                print('{:<20}{:<12}{:>12}{:>12.6f}{:>9}  new'.format(pos, name, '-', now['time'], '-'))
+                continue
+            ratio = now['time'] / base['time'] if base['time'] > 0 else 1.0
+            notes = []
+            if ratio > threshold and base['time'] >= min_time:
+                notes.append('slower')
+                ok = ok and not time_gate
+            if now['nodes'] != base['nodes']:
+                notes.append(f'nodes {base["nodes"]} -> {now["nodes"]}')
+                ok = False
+            if (now['flags'], now['spaces'], now['guess']) != (base['flags'], base['spaces'], base['guess']):
+                notes.append('results changed')
+                ok = False
+            print('{:<20}{:<12}{:>12.6f}{:>12.6f}{:>9.3f}  {}'.format(pos, name, base['time'], now['time'], ratio, ', '.join(notes)))
+    return ok
+
+def main():
+    import argparse, platform
+    parser = argparse.ArgumentParser(description='benchmark every solver on saved positions')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(HERE, 'positions')], help='position files or directories')
+    parser.add_argument('-s', '--solvers', nargs='+', default=list(SOLVERS), choices=list(SOLVERS), help='solvers to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per solver and position, the fastest is kept (default: 3)')
+    parser.add_argument('--walkall_limit', type=int, default=24, help='skip walkall on positions with more unknown cells (default: 24)')
+    parser.add_argument('-o', '--output', type=str, default=None, help='write the results as JSON')
+    parser.add_argument('-b', '--baseline', type=str, default=None, help='compare with a JSON file written by --output, e.g. positions/baseline.json')
+    parser.add_argument('--threshold', type=float, default=1.25, help='time ratio above the baseline that is marked slower (default: 1.25)')
+    parser.add_argument('--min_time', type=float, default=0.01, help='only mark positions whose baseline time is at least this many seconds (default: 0.01)')
+    parser.add_argument('--time_gate', action='store_true', default=False, help='fail when a position is marked slower; only meaningful against a baseline from the same machine')
+    args = parser.parse_args()
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'repeat': args.repeat, 'results': {}, 'problems': {}}
+    print('{:<20}'.format('position') + ''.join(['{:>24}'.format(name + ' time/nodes') for name in args.solvers]))
+    for pos in load_positions(args.paths):
+        unknowns = sum([1 for col in pos.cells for cell in col if cell == CellStatus.Unknown])
+        line = '{:<20}'.format(pos.name)
+        stats = {}
+        results = {}
+        for name in args.solvers:
+            if name == 'walkall' and unknowns > args.walkall_limit:
+                line += '{:>24}'.format('skipped')
+                continue
+            stats[name], flags, spaces, probability = run_solver(name, pos, args.repeat)
+            results[name] = (flags, spaces, probability)
+            line += '{:>13.6f}s{:>10}'.format(stats[name]['time'], '-' if stats[name]['nodes'] is None else stats[name]['nodes'])
+        report['results'][pos.name] = stats
+        problems = check_agreement(results)
+        if problems:
+            report['problems'][pos.name] = problems
+            line += '  disagree!'
+        print(line)
+        for problem in problems:
+            print('    ' + problem)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    ok = len(report['problems']) < 1
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            ok = compare(report, json.load(f), args.threshold, args.min_time, args.time_gate) and ok
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
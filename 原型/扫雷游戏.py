@@ -16,6 +16,9 @@ mineCount = int(sys.argv[3])
 ms = Minesweeper(width, height)
 isGenerate = False
 
+# 按1求解时最多等待的秒数, 超时则显示目前为止的结果
+solveTimeLimit = 5
+
 cellWid = 60
 centerFontSize = 20
 topFontSize = 16
@@ -36,9 +39,10 @@ def all_draw():
     for j in range(cellWid, height * (cellWid + 1) - 1, cellWid + 1):
         pygame.draw.line(screen, (0,0,0), (0, j), (cellWid * width + width - 1, j))
 
+    cells = ms.cells_view
     for i in range(width):
         for j in range(height):
-            cell = ms.cells[i][j]
+            cell = cells[i][j]
             cellRect = pl.Rect((i * (cellWid + 1), j * (cellWid + 1)), (cellWid, cellWid))
             if cell == CellStatus.Space:
                 pass
@@ -107,10 +111,10 @@ while True:
                     sys.exit()
         elif event.type == pygame.KEYDOWN:
             if event.key == pl.K_1:
-                solver = MinesweeperSolverByFloodfill(ms)
+                solver = MinesweeperSolverByFloodfill(ms, counting=True)
                 print('begin run')
-                toFlags, toSpaces = solver.run()
-                print('finish run')
+                toFlags, toSpaces = solver.run(time_limit=solveTimeLimit)
+                print('finish run' if solver.is_complete else 'time out')
                 if len(toFlags) + len(toSpaces) < 1:
                     print('need guess')
                 probability = solver.probability
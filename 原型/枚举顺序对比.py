@@ -0,0 +1,60 @@
+import os, sys
+from time import time
+from MinesweeperSolver import MinesweeperSolverByFloodfill, MinesweeperSolverByFloodfillAndGroup, ORDERS
+from MinesweeperPosition import load_positions
+
+SOLVERS = {
+    'floodfill': lambda pos, order, workers, pool: MinesweeperSolverByFloodfill(pos, counting=True, order=order, workers=workers, pool=pool),
+    'group': lambda pos, order, workers, pool: MinesweeperSolverByFloodfillAndGroup(pos, order=order, workers=workers, pool=pool),
+}
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='compare enumeration orders on saved positions')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), 'positions')], help='position files or directories')
+    parser.add_argument('-o', '--orders', nargs='+', default=list(ORDERS), choices=list(ORDERS), help='orders to compare')
+    parser.add_argument('-s', '--solver', default='floodfill', choices=list(SOLVERS), help='solver to run')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='enumerate in a process pool (default: serial)')
+    args = parser.parse_args()
+
+    # 所有局面共用一个进程池
+    pool = None
+    if args.workers is not None and args.workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(args.workers)
+    try:
+        same = compare(args, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if not same:
+        sys.exit(1)
+
+def compare(args, pool):
+    '逐个局面比较各顺序的节点数和用时, 返回各顺序的结果是否都相同'
+
+    print('{:<16}'.format('position') + ''.join(['{:>26}'.format(order + ' nodes/time') for order in args.orders]))
+    total = {order: [0, 0] for order in args.orders}
+    same = True
+    for pos in load_positions(args.paths):
+        line = '{:<16}'.format(pos.name)
+        results = []
+        for order in args.orders:
+            solver = SOLVERS[args.solver](pos, order, args.workers, pool)
+            start = time()
+            flags, spaces = solver.run()
+            use_time = time() - start
+            results.append((flags, spaces, solver.probability))
+            total[order][0] += solver.node_count
+            total[order][1] += use_time
+            line += '{:>16}{:>9.3f}s'.format(solver.node_count, use_time)
+        if any([result != results[0] for result in results[1:]]):
+            same = False
+            line += '  results differ!'
+        print(line)
+    print('{:<16}'.format('total') + ''.join(['{:>16}{:>9.3f}s'.format(*total[order]) for order in args.orders]))
+    return same
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
-import sys, pickle
+import sys, pickle, random
 from MinesweeperGenerate import Minesweeper, CellStatus
-from MinesweeperSolver import MinesweeperSolverByWalkAll, MinesweeperSolverByFloodfill, MinesweeperSolverByFloodfillAndGroup, MinesweeperSolverByNumber
+from MinesweeperBitboard import MinesweeperBitboard
+from MinesweeperSolver import MinesweeperSolverByWalkAll, MinesweeperSolverByFloodfill, MinesweeperSolverByFloodfillAndGroup, MinesweeperSolverByNumber, MinesweeperSolverSession, component_cache
+from MinesweeperRecord import GameRecord, GameRecordArchive, GameRecordWriter, check_record_target, is_record_file
+from MinesweeperMetrics import JsonlSink, MemorySink, set_context, summarize, use_sink
+from MinesweeperNoGuess import MAX_RESTARTS, generate_no_guess
 from enum import Enum
 from time import time
 
@@ -13,15 +17,45 @@ class GameMode(Enum):
     unknown = 0
     new = 1
     load = 2
+    batch = 3
+    replay = 4
+
+# 值为 (棋盘, 随机种子) -> 求解器, 种子只用于超时后的蒙特卡洛估计, None为不固定
+SOLVERS = {
+    'session': lambda ms, seed: MinesweeperSolverSession(ms),
+    'number': lambda ms, seed: MinesweeperSolverByNumber(ms),
+    'floodfill': lambda ms, seed: MinesweeperSolverByFloodfill(ms, counting=True, seed=seed),
+    'group': lambda ms, seed: MinesweeperSolverByFloodfillAndGroup(ms, cache=component_cache),
+}
+
+def percentile(values, q):
+    '最近秩法的百分位数, q ∈[0,100]'
+    if len(values) < 1:
+        return 0
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(q * len(values) / 100 + 0.5) - 1))]
 
 class AutoRun:
-    def __init__(self):
+    def __init__(self, bitboard = False):
         self.game_mode = GameMode.unknown
+        self.bitboard = bitboard
+        self.check_counters = False
         self.win = False
         self.use_time = 0
         self.show_time = False
         self.show_step = False
+        self.show_guess_times = False
         self.hide_result = False
+        self.solver = 'session'
+        self.time_limit = None
+        self.stream = False
+        self.metrics = None
+        self.no_guess = False
+        self.max_restarts = MAX_RESTARTS
+        # 这一局的随机种子, 不为None时求解器的随机种子由它导出
+        self.game_seed = None
+        self.guess_times = 0
+        self.solver_times = []
 
     def arg_parse(self):
         import argparse
@@ -30,6 +64,14 @@ class AutoRun:
         parser.add_argument('--show_time', default=False, action='store_true', help='show time')
         parser.add_argument('--show_guess_times', default=False, action='store_true', help='show guess times')
         parser.add_argument('--hide_result', default=False, action='store_true', help='show time')
+        parser.add_argument('--bitboard', default=False, action='store_true', help='use bitboard engine')
+        parser.add_argument('--check_counters', default=False, action='store_true', help='verify board counters with full scans (debug)')
+        parser.add_argument('--solver', default='session', choices=list(SOLVERS), help='solver (default: session)')
+        parser.add_argument('--time_limit', type=float, default=None, help='seconds per solver call (default: no limit)')
+        parser.add_argument('--stream', default=False, action='store_true', help='execute each deduction as soon as it is proven')
+        parser.add_argument('--metrics', type=str, default=None, help='append a JSON line per solver call to this file (new, load and batch modes)')
+        parser.add_argument('--no_guess', default=False, action='store_true', help='generate boards that can be solved without guessing (new and batch modes)')
+        parser.add_argument('--max_restarts', type=int, default=MAX_RESTARTS, help=f'with --no_guess, new random boards per game before giving up (default: {MAX_RESTARTS})')
 
         subparsers = parser.add_subparsers(help='game mode')
 
@@ -39,28 +81,64 @@ class AutoRun:
         new_game.add_argument('mineCount', type=int, help='mine count of minesweeper board')
         new_game.add_argument('startx', type=int, help='col for the first click')
         new_game.add_argument('starty', type=int, help='row for the first click')
-        new_game.add_argument('-s', '--saveFile', type=str, default=None, help='file path for save')
+        new_game.add_argument('-s', '--saveFile', type=str, default=None, help='file path for save, overwritten unless --append')
+        new_game.add_argument('--append', action='store_true', default=False, help='append the game to the record archive in saveFile instead of overwriting it')
         new_game.set_defaults(func=self.new_game_func)
 
         load_game = subparsers.add_parser('load', help='load a game from file')
         load_game.add_argument('recordFile', type=str, help='file path for save')
         load_game.add_argument('-u', '--useOps', action='store_true', default=False, help='use ops (default: not)')
+        load_game.add_argument('-i', '--index', type=int, default=0, help='game index in a record archive (default: 0)')
+        load_game.add_argument('--verify', action='store_true', default=False, help='with --useOps, compare each step with the solver (default: not)')
         load_game.set_defaults(func=self.load_game_func)
 
+        batch_game = subparsers.add_parser('batch', help='play many new games in a process pool')
+        batch_game.add_argument('width', type=int, help='width of minesweeper board')
+        batch_game.add_argument('height', type=int, help='height of minesweeper board')
+        batch_game.add_argument('mineCount', type=int, help='mine count of minesweeper board')
+        batch_game.add_argument('-n', '--games', type=int, default=100, help='number of games (default: 100)')
+        batch_game.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: cpu count)')
+        batch_game.add_argument('--seed', type=int, default=0, help='seed of the first game, game i uses seed + i (default: 0)')
+        batch_game.add_argument('--startx', type=int, default=None, help='col for the first click (default: center)')
+        batch_game.add_argument('--starty', type=int, default=None, help='row for the first click (default: center)')
+        batch_game.add_argument('-s', '--saveFile', type=str, default=None, help='record archive to append all games to')
+        batch_game.add_argument('-c', '--cacheFile', type=str, default=None, help='load and save the component solution cache of the group solver')
+        batch_game.set_defaults(func=self.batch_func)
+
+        replay_game = subparsers.add_parser('replay', help='replay recorded games and verify them')
+        replay_game.add_argument('paths', nargs='+', help='record archives, legacy pickle records or directories (only archives are read from directories)')
+        replay_game.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: cpu count)')
+        replay_game.add_argument('--verify', action='store_true', default=False, help='compare each step with the solver (default: not)')
+        replay_game.set_defaults(func=self.replay_func)
+
         args = parser.parse_args()
         self.show_time = args.show_time
         self.show_step = args.show_step
         self.show_guess_times = args.show_guess_times
         self.hide_result = args.hide_result
+        self.bitboard = args.bitboard
+        self.check_counters = args.check_counters
+        self.solver = args.solver
+        self.time_limit = args.time_limit
+        self.stream = args.stream
+        self.metrics = args.metrics
+        self.no_guess = args.no_guess
+        self.max_restarts = args.max_restarts
         args.func(args)
 
     def new_game_func(self, args):
-        self.new_game_init(args.width, args.height, args.mineCount, args.startx, args.starty, args.saveFile)
+        self.new_game_init(args.width, args.height, args.mineCount, args.startx, args.starty, args.saveFile, args.append)
 
     def load_game_func(self, args):
-        self.load_game_init(args.recordFile, args.useOps)
+        self.load_game_init(args.recordFile, args.useOps, args.index, args.verify)
 
-    def new_game_init(self, width, height, mineCount, startx, starty, saveFile = None):
+    def batch_func(self, args):
+        self.batch_init(args.width, args.height, args.mineCount, args.games, args.workers, args.seed, args.startx, args.starty, args.saveFile, args.cacheFile)
+
+    def replay_func(self, args):
+        self.replay_init(args.paths, args.workers, args.verify)
+
+    def new_game_init(self, width, height, mineCount, startx, starty, saveFile = None, append = False):
         self.game_mode = GameMode.new
         self.width = width
         self.height = height
@@ -68,14 +146,49 @@ class AutoRun:
         self.startx = startx
         self.starty = starty
         self.saveFile = saveFile
+        self.append = append
 
-    def load_game_init(self, recordFile, useOps = False):
+    def batch_init(self, width, height, mineCount, games, workers = None, seed = 0, startx = None, starty = None, saveFile = None, cacheFile = None):
+        self.game_mode = GameMode.batch
+        self.saveFile = saveFile
+        self.cacheFile = cacheFile
+        self.width = width
+        self.height = height
+        self.mineCount = mineCount
+        self.games = games
+        self.workers = workers
+        self.seed = seed
+        self.startx = width // 2 if startx is None else startx
+        self.starty = height // 2 if starty is None else starty
+
+    def replay_init(self, paths, workers = None, verify = False):
+        self.game_mode = GameMode.replay
+        self.paths = paths
+        self.workers = workers
+        self.verify = verify
+
+    def load_game_init(self, recordFile, useOps = False, index = 0, verify = False):
         self.game_mode = GameMode.load
         self.recordFile = recordFile
         self.useOps = useOps
+        self.verify = verify
 
-        with open(self.recordFile, 'rb') as f:
-            recordData = pickle.load(f)
+        if is_record_file(self.recordFile):
+            with GameRecordArchive(self.recordFile) as archive:
+                if not -len(archive) <= index < len(archive):
+                    raise IndexError(f'{self.recordFile} 中只有{len(archive)}局')
+                record = archive[index]
+            recordData = {
+                'width': record.width,
+                'height': record.height,
+                'mineCount': record.mineCount,
+                'mines': record.mines,
+                'ops': [{'type': MinesweeperOperator(t), 'x': x, 'y': y} for t, x, y in record.ops],
+            }
+        else:
+            # 旧的pickle记录
+            with open(self.recordFile, 'rb') as f:
+                recordData = pickle.load(f)
 
         self.width = recordData['width']
         self.height = recordData['height']
@@ -89,11 +202,33 @@ class AutoRun:
             self.ops = recordData['ops']
 
     def run(self):
-        self.ms = Minesweeper(self.width, self.height)
+        if self.game_mode == GameMode.batch:
+            return self.batch_run()
+        if self.game_mode == GameMode.replay:
+            return self.replay_run()
+        if self.metrics is None:
+            # 批量模式的子进程中由 play_game 设置输出端
+            return self.game_run()
+        with use_sink(JsonlSink(self.metrics)):
+            return self.game_run()
+
+    def game_run(self):
+        '新开或载入的一局, 返回是否获胜'
+        if self.bitboard:
+            self.ms = MinesweeperBitboard(self.width, self.height)
+        else:
+            self.ms = Minesweeper(self.width, self.height, self.check_counters)
         assert self.game_mode != GameMode.unknown
         if self.game_mode == GameMode.new:
-            self.ms.generate(self.mineCount, self.startx, self.starty)
-            self.save_game(self.new_game_run())
+            if self.saveFile is not None:
+                # 在开始之前检查, 不要玩完一局才发现不能追加
+                check_record_target(self.saveFile, self.append)
+            if self.no_guess:
+                generate_no_guess(self.ms, self.mineCount, self.startx, self.starty, random.getrandbits(64), max_restarts=self.max_restarts)
+            else:
+                self.ms.generate(self.mineCount, self.startx, self.starty)
+            self.played_ops = self.new_game_run()
+            self.save_game(self.played_ops)
         else:
             self.ms.mines = self.mines
             if self.useOps:
@@ -108,12 +243,26 @@ class AutoRun:
         nextops = [{'type': MinesweeperOperator.to_open, 'x': self.startx, 'y': self.starty}]
         die = False
         guess_times = 0
+        self.solver_times = []
+        session = MinesweeperSolverSession(self.ms) if self.solver == 'session' else None
+        seeds = None if self.game_seed is None else random.Random(self.game_seed)
         while not self.ms.is_win():
             if len(nextops) < 1:
-                solver = MinesweeperSolverByNumber(self.ms)
-                # solver = MinesweeperSolverByFloodfill(self.ms)
-                toFlags, toSpaces = solver.run()
-                if solver.is_advance:
+                solver = session if session is not None else SOLVERS[self.solver](self.ms, None if seeds is None else seeds.getrandbits(64))
+                if self.stream:
+                    die, streamed = self.stream_ops(solver, ops)
+                    if solver.is_guess:
+                        guess_times += 1
+                    if die:
+                        break
+                    if streamed:
+                        continue
+                    toFlags, toSpaces = set(), set()
+                else:
+                    solve_start = time()
+                    toFlags, toSpaces = solver.run(time_limit=self.time_limit)
+                    self.solver_times.append(time() - solve_start)
+                if getattr(solver, 'is_advance', False):
                     if self.show_step:
                         cells = self.ms.all_cells
                         for i, j in toFlags:
@@ -143,44 +292,33 @@ class AutoRun:
                     if self.show_step:
                         print('need guess')
                     probability = solver.probability
-                    cells = self.ms.all_cells
+                    cells = self.ms.cells_view
                     if self.show_step:
                         self.ms.show(cells)
                     next_point = None
                     for i in range(self.width):
                         for j in range(self.height):
-                            if probability[i][j] is not None and cells[i][j] == CellStatus.Unknown:
+                            if probability is not None and probability[i][j] is not None and cells[i][j] == CellStatus.Unknown:
                                 if next_point is None:
                                     next_point = (i, j)
                                 elif probability[i][j] < probability[next_point[0]][next_point[1]]:
                                     next_point = (i, j)
+                    if next_point is None:
+                        # 求解器在截止时间内没有给出概率, 随便猜一个
+                        next_point = random.choice([(i, j) for i in range(self.width) for j in range(self.height) if cells[i][j] == CellStatus.Unknown])
                     if next_point is not None:
-                        if self.show_step:
+                        if self.show_step and probability is not None:
                             print(probability[next_point[0]][next_point[1]])
                         nextops.append({'type': MinesweeperOperator.to_open, 'x': next_point[0], 'y': next_point[1]})
                         guess_times += 1
             op = nextops.pop(0)
             ops.append(op)
-            if op['type'] == MinesweeperOperator.to_open:
-                if self.show_step:
-                    print(f'open ({op["x"]},{op["y"]})')
-                if not self.ms.open(op['x'], op['y']):
-                    if not self.hide_result:
-                        print(f'die')
-                    die = True
-                    break
-            elif op['type'] == MinesweeperOperator.to_flag:
-                if self.show_step:
-                    print(f'flag ({op["x"]},{op["y"]})')
-                self.ms.flag(op['x'], op['y'])
-            elif op['type'] == MinesweeperOperator.to_open_final:
-                if self.show_step:
-                    print(f'open final ({op["x"]},{op["y"]})')
-                if not self.ms.open_final(op['x'], op['y']):
-                    if not self.hide_result:
-                        print(f'die')
-                    die = True
-                    break
+            if not self.do_op(op):
+                die = True
+                break
+        if session is not None:
+            self.ms.unsubscribe(session.update)
+        self.guess_times = guess_times
         if not die:
             if not self.hide_result:
                 print('win')
@@ -192,19 +330,329 @@ class AutoRun:
             print(f'guess times: {guess_times}')
         return ops
 
+    def game_record(self, ops):
+        return GameRecord.from_mines(self.ms.mines, [(op['type'].value, op['x'], op['y']) for op in ops])
+
+    def do_op(self, op):
+        '执行一个操作, 返回是否还活着'
+        if op['type'] == MinesweeperOperator.to_open:
+            if self.show_step:
+                print(f'open ({op["x"]},{op["y"]})')
+            if not self.ms.open(op['x'], op['y']):
+                if not self.hide_result:
+                    print(f'die')
+                return False
+        elif op['type'] == MinesweeperOperator.to_flag:
+            if self.show_step:
+                print(f'flag ({op["x"]},{op["y"]})')
+            self.ms.flag(op['x'], op['y'])
+        elif op['type'] == MinesweeperOperator.to_open_final:
+            if self.show_step:
+                print(f'open final ({op["x"]},{op["y"]})')
+            if not self.ms.open_final(op['x'], op['y']):
+                if not self.hide_result:
+                    print(f'die')
+                return False
+        return True
+
+    def stream_ops(self, solver, ops):
+        '''
+        边推导边执行: 求解器每证明一个格子就立即标旗或点开,
+        点开后的变化通过订阅反馈给 MinesweeperSolverSession, 同一次推导中继续使用
+
+        返回值:
+            (是否踩雷, 是否执行了操作)
+        '''
+        deductions = solver.stream(self.time_limit)
+        solve_time = 0
+        streamed = False
+        try:
+            while not self.ms.is_win():
+                solve_start = time()
+                item = next(deductions, None)
+                solve_time += time() - solve_start
+                if item is None:
+                    break
+                x, y, status = item
+                op = {'type': MinesweeperOperator.to_flag if status == CellStatus.ToFlag else MinesweeperOperator.to_open, 'x': x, 'y': y}
+                ops.append(op)
+                streamed = True
+                if not self.do_op(op):
+                    return (True, streamed)
+        finally:
+            deductions.close()
+            self.solver_times.append(solve_time)
+        return (False, streamed)
+
     def save_game(self, ops):
         if self.saveFile is not None:
-            with open(self.saveFile, 'wb') as f:
-                pickle.dump({
-                    'width': self.width,
-                    'height': self.height,
-                    'mineCount': self.mineCount,
-                    'mines': self.ms.mines,
-                    'ops': ops
-                }, f)
+            with GameRecordWriter(self.saveFile, self.append) as writer:
+                writer.write_game(self.game_record(ops))
 
     def load_game_run(self):
-        pass
+        start_time = time()
+        replay = replay_ops(self.ms, [(op['type'].value, op['x'], op['y']) for op in self.ops], self.solver if self.verify else None)
+        self.use_time = time() - start_time
+        self.win = replay['result'] == 'win' and len(replay['mismatches']) < 1
+        if not self.hide_result:
+            print(replay['result'])
+            for step in replay['mismatches']:
+                print(f'step {step} differs from solver')
+        if self.show_time:
+            print(f'time: {self.use_time}s')
+
+    def replay_run(self):
+        '''
+        用进程池重放 self.paths 中的所有对局, 统计结果
+        二进制存档中的每一局都会被重放; 直接给出的其他文件按旧的pickle记录读取, 目录中的其他文件被跳过
+
+        返回值:
+            所有对局都正常结束且(--verify时)与求解器一致则为True
+        '''
+        from multiprocessing import Pool
+        tasks = ((record, self.solver if self.verify else None, self.bitboard) for record in load_records(self.paths))
+        start_time = time()
+        if self.workers == 1:
+            results = [replay_game(task) for task in tasks]
+        else:
+            with Pool(self.workers) as pool:
+                results = list(pool.imap(replay_game, tasks, chunksize=64))
+        self.use_time = time() - start_time
+        self.replay_results = results
+
+        counts = {}
+        for result in results:
+            counts[result['result']] = counts.get(result['result'], 0) + 1
+        mismatched = sum([1 for result in results if len(result['mismatches']) > 0])
+        steps = sum([result['steps'] for result in results])
+        print(f'games: {len(results)}, ' + ', '.join([f'{name}: {counts.get(name, 0)}' for name in ('win', 'die', 'unfinished', 'invalid')]))
+        if self.verify:
+            print(f'solver: {self.solver}, games differ from solver: {mismatched}')
+        print(f'time: {self.use_time:.3f}s, {len(results) / max(self.use_time, 1e-9):.1f} games/s, {steps / max(self.use_time, 1e-9):.1f} ops/s')
+        return counts.get('unfinished', 0) + counts.get('invalid', 0) + mismatched < 1
+
+    def batch_run(self):
+        '''
+        用进程池玩 self.games 局, 第i局在子进程中以 self.seed + i 为随机种子, 结果可复现
+        指定了 self.cacheFile 时, 各进程先读入分组穷举的置换表, 结束后把各局新加入的项合并保存
+        '''
+        from multiprocessing import Pool
+        if self.saveFile is not None:
+            check_record_target(self.saveFile)
+        tasks = [
+            (self.seed + i, self.width, self.height, self.mineCount, self.startx, self.starty, self.solver, self.time_limit, self.stream, self.bitboard, self.saveFile is not None, self.cacheFile is not None, self.metrics is not None, self.no_guess, self.max_restarts)
+            for i in range(self.games)
+        ]
+        start_time = time()
+        if self.workers == 1:
+            init_batch_worker(self.cacheFile)
+            results = [play_game(task) for task in tasks]
+        else:
+            with Pool(self.workers, initializer=init_batch_worker, initargs=(self.cacheFile,)) as pool:
+                results = pool.map(play_game, tasks, chunksize=1)
+        self.use_time = time() - start_time
+        self.batch_results = results
+        if self.saveFile is not None:
+            with GameRecordWriter(self.saveFile) as writer:
+                for result in results:
+                    writer.write_game(result['record'])
+        if self.cacheFile is not None:
+            component_cache.load(self.cacheFile)
+            for result in results:
+                for key, value in result['cache_entries']:
+                    component_cache.put(key, value)
+            component_cache.save(self.cacheFile)
+        if self.metrics is not None:
+            sink = JsonlSink(self.metrics)
+            try:
+                for result in results:
+                    for record in result['metrics']:
+                        sink.write(record)
+            finally:
+                sink.close()
+
+        times = [result['time'] for result in results]
+        solver_times = [t for result in results for t in result['solver_times']]
+        wins = sum([1 for result in results if result['win']])
+        print(f'games: {len(results)}, solver: {self.solver}, seed: {self.seed}' + (', no-guess boards' if self.no_guess else ''))
+        print(f'win rate: {wins / max(1, len(results)) * 100:.2f}% ({wins}/{len(results)})')
+        print(f'guesses per game: {sum([result["guess_times"] for result in results]) / max(1, len(results)):.3f}')
+        print(f'time per game: mean {sum(times) / max(1, len(times)):.6f}s, p50 {percentile(times, 50):.6f}s, p99 {percentile(times, 99):.6f}s')
+        print(f'time per solver call: mean {sum(solver_times) / max(1, len(solver_times)):.6f}s, p50 {percentile(solver_times, 50):.6f}s, p99 {percentile(solver_times, 99):.6f}s, calls {len(solver_times)}')
+        boards = [result['board'] for result in results]
+        if boards:
+            board = ', '.join([f'{name} {sum([b[name] for b in boards]) / len(boards):.2f}' for name in ['3BV', 'openings', 'islands', 'zini']])
+            print(f'board per game: {board}')
+            # 按ZiNi分成难度相同的四档, 各档的胜率
+            order = sorted(range(len(results)), key=lambda i: boards[i]['zini'])
+            quarters = [order[len(order) * k // 4:len(order) * (k + 1) // 4] for k in range(4)]
+            print('win rate by zini quartile: ' + ', '.join([
+                f'<= {boards[q[-1]]["zini"]}: {sum([1 for i in q if results[i]["win"]]) / len(q) * 100:.2f}%' for q in quarters if q
+            ]))
+        hits = sum([result['cache_hits'] for result in results])
+        misses = sum([result['cache_misses'] for result in results])
+        if hits + misses > 0:
+            print(f'component cache: hits {hits}, misses {misses}, hit rate {hits / (hits + misses) * 100:.2f}%')
+        if self.metrics is not None:
+            for solver, summary in summarize([record for result in results for record in result['metrics']]).items():
+                phases = ''.join([f', {name} {t:.3f}s' for name, t in summary['phases'].items()])
+                print(f'{solver}: calls {summary["calls"]}, time {summary["time"]:.3f}s, nodes {summary["nodes"]}{phases}')
+        if self.show_time:
+            print(f'time: {self.use_time}s')
+        return True
+
+def init_batch_worker(cacheFile):
+    '批量模式的进程初始化: 读入置换表并开始记录新加入的项'
+    if cacheFile is not None:
+        component_cache.load(cacheFile)
+        component_cache.start_journal()
+
+def play_game(task):
+    '''
+    批量模式中在子进程里玩一局
+
+    参数:
+        task: (随机种子, 宽, 高, 雷数, 起始点横坐标, 起始点纵坐标, 求解器, 每次求解的时间限制, 是否边推导边执行, 是否使用位棋盘, 是否返回对局记录, 是否返回置换表新加入的项, 是否返回求解器的记录, 是否生成无猜棋盘, 无猜棋盘最多重新生成的次数)
+
+    返回值:
+        一局的统计, dict
+    '''
+    seed, width, height, mineCount, startx, starty, solver, time_limit, stream, bitboard, withRecord, withCache, withMetrics, noGuess, maxRestarts = task
+    random.seed(seed)
+    hits, misses = component_cache.hits, component_cache.misses
+    set_context(seed=seed if withMetrics else None)
+    autoRun = AutoRun(bitboard)
+    autoRun.hide_result = True
+    autoRun.solver = solver
+    autoRun.time_limit = time_limit
+    autoRun.stream = stream
+    autoRun.no_guess = noGuess
+    autoRun.max_restarts = maxRestarts
+    autoRun.game_seed = seed
+    autoRun.new_game_init(width, height, mineCount, startx, starty)
+    with use_sink(MemorySink() if withMetrics else None) as sink:
+        autoRun.run()
+    return {
+        'seed': seed,
+        'win': autoRun.win,
+        'guess_times': autoRun.guess_times,
+        'time': autoRun.use_time,
+        'solver_times': autoRun.solver_times,
+        '3BV': autoRun.ms._3BV,
+        'board': autoRun.ms.stats.as_dict(),
+        'record': autoRun.game_record(autoRun.played_ops) if withRecord else None,
+        'cache_hits': component_cache.hits - hits,
+        'cache_misses': component_cache.misses - misses,
+        'cache_entries': component_cache.new_entries() if withCache else [],
+        'metrics': sink.records if withMetrics else [],
+    }
+
+def replay_ops(ms, ops, solver = None):
+    '''
+    不调用求解器, 把记录的操作重新作用到棋盘上
+
+    参数:
+        ms: 已经设置好雷的棋盘
+        ops: 操作, list[(类型, x, y)], 类型为 MinesweeperOperator 的值
+        solver: 求解器名(SOLVERS中的键), 不为None时检查第一步之后的每个操作: 标旗的格子须是求解器证明为雷的,
+            点开的格子须是证明为空白的; 还没有操作的已证明的格子都不是未知格子时这一步是猜的, 不检查;
+            已经不是未知格子的格子上的操作(例如证明之后被连锁展开的格子)没有作用, 也不检查
+
+    返回值:
+        dict:
+            result: 'win'/'die', 操作执行完棋局还未结束为'unfinished', 结束后还有操作或操作类型错误为'invalid'
+            steps: 执行的操作数
+            mismatches: 求解器没有证明的操作的下标
+    '''
+    session = MinesweeperSolverSession(ms) if solver == 'session' else None
+    # 求解器在之前的局面证明而还没有执行的操作, 之后的局面中仍然成立
+    proven = set()
+    mismatches = []
+    result = 'unfinished'
+    steps = 0
+    for i, (t, x, y) in enumerate(ops):
+        if result != 'unfinished':
+            result = 'invalid'
+            break
+        if solver is not None and i > 0 and (t, x, y) not in proven and ms.cells_view[x][y] == CellStatus.Unknown:
+            # 按操作逐个检查而不是与整批结果比较: 边推导边执行的对局、别的求解器下的对局, 操作的顺序和分批都不同.
+            # 取完 stream 而不只是 run 的一批: MinesweeperSolverByNumber 的 run 只给出第一个有结果的阶段
+            s = session if session is not None else SOLVERS[solver](ms, None)
+            items = list(s.stream())
+            if not s.is_guess:
+                proven |= set([((MinesweeperOperator.to_flag if status == CellStatus.ToFlag else MinesweeperOperator.to_open).value, px, py) for px, py, status in items])
+            # 连锁展开时点开的格子不再需要操作
+            cells = ms.cells_view
+            proven = set([op for op in proven if cells[op[1]][op[2]] == CellStatus.Unknown])
+            if len(proven) > 0 and (t, x, y) not in proven:
+                mismatches.append(i)
+        proven.discard((t, x, y))
+        steps += 1
+        if t == MinesweeperOperator.to_open.value:
+            alive = ms.open(x, y)
+        elif t == MinesweeperOperator.to_flag.value:
+            ms.flag(x, y)
+            alive = True
+        elif t == MinesweeperOperator.to_open_final.value:
+            alive = ms.open_final(x, y)
+        else:
+            result = 'invalid'
+            break
+        if not alive:
+            result = 'die'
+        elif ms.is_win():
+            result = 'win'
+    if session is not None:
+        ms.unsubscribe(session.update)
+    return {'result': result, 'steps': steps, 'mismatches': mismatches}
+
+def load_records(paths):
+    '''
+    依次读取对局记录
+
+    目录中只读取二进制存档, 其他文件跳过并在标准错误中说明, 不会被反序列化;
+    旧的pickle记录只有在直接给出文件名时才读取.
+
+    返回值:
+        GameRecord 的生成器
+    '''
+    import os
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                file = os.path.join(path, name)
+                if not os.path.isfile(file):
+                    continue
+                if is_record_file(file):
+                    files.append(file)
+                else:
+                    print(f'skipped {file}: not a record archive', file=sys.stderr)
+        else:
+            files.append(path)
+    for path in files:
+        if is_record_file(path):
+            with GameRecordArchive(path) as archive:
+                yield from archive
+        else:
+            with open(path, 'rb') as f:
+                recordData = pickle.load(f)
+            yield GameRecord.from_mines(recordData['mines'], [(op['type'].value, op['x'], op['y']) for op in recordData['ops']])
+
+def replay_game(task):
+    '''
+    重放模式中在子进程里重放一局
+
+    参数:
+        task: (GameRecord, 求解器名或None, 是否使用位棋盘)
+
+    返回值:
+        replay_ops 的结果
+    '''
+    record, solver, bitboard = task
+    ms = MinesweeperBitboard(record.width, record.height) if bitboard else Minesweeper(record.width, record.height)
+    ms.mines = record.mines
+    return replay_ops(ms, record.ops, solver)
 
 def main():
     autoRun = AutoRun()